@@ -1,53 +1,66 @@
+if __name__ == '__main__':
+    # Serve on gevent when it is installed, so idle /events/rates streams are
+    # greenlets instead of threads; patching has to happen before other imports
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        monkey = None
+
 from flask import Flask, render_template, request, redirect, url_for, flash, session
-import firebase_admin
-from firebase_admin import credentials, db
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import os
+import time
 from datetime import datetime
 import uuid
+from catalog import CatalogSnapshot
+from pricing import PriceEngine
+from search_index import SearchIndex
+from facets import FacetIndex
+from pagination import Paginator
+from response_cache import ResponseCache, cached_page, version_tag, versioned_page, normalized_args
+from catalog_api import PayloadCache, parse_fields, negotiate, mimetype, list_body
+from config_cache import ConfigCache, CONFIG_NODES
+from fanout import fetch_parallel
+from storage import create_backend, start_call_count, call_count
+from repositories import Repositories, is_valid_key
+from web_assets import WebAssets
+from image_proxy import ImageReferences, document_file_id
+from normalize import normalize_product, normalize_category, product_errors
+from rate_history import RateHistory, chart_geometry
+from events import SSE_MIMETYPE, create_hub
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'
 app.config['UPLOAD_FOLDER'] = 'static/images/products'
 app.config['PERMANENT_SESSION_LIFETIME'] = 5184000  # 60 days
 
-# Initialize Firebase
-import json
-import tempfile
-
-# Try local config first, then environment variables
-try:
-    cred = credentials.Certificate('firebase_config.json')
-except FileNotFoundError:
-    # Create Firebase config from environment variables
-    firebase_config = {
-        "type": "service_account",
-        "project_id": "samrat-4d6b3",
-        "private_key_id": os.environ.get('FIREBASE_PRIVATE_KEY_ID'),
-        "private_key": os.environ.get('FIREBASE_PRIVATE_KEY', ''),
-        "client_email": os.environ.get('FIREBASE_CLIENT_EMAIL'),
-        "client_id": os.environ.get('FIREBASE_CLIENT_ID'),
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_x509_cert_url": f"https://www.googleapis.com/robot/v1/metadata/x509/{os.environ.get('FIREBASE_CLIENT_EMAIL', '')}"
-    }
-    
-    # Write config to temporary file
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-        json.dump(firebase_config, f)
-        temp_config_path = f.name
-    
-    cred = credentials.Certificate(temp_config_path)
+SHOP_PAGE_SIZE = 24
+API_MAX_LIMIT = 100
+ADMIN_PAGE_SIZE = 50
+CONFIG_CACHE_TTL = 60  # seconds before settings/categories/rates are re-read
+RATE_METALS = ('gold', 'silver')
+RATE_CHART_DAYS = 365
+RATE_HISTORY_MAX_DAYS = 5 * 366
+SSE_MAX_PRODUCT_IDS = 100  # prices pushed per /events/rates stream
+
+# Firebase by default; STORAGE_BACKEND=sqlite or memory runs the app offline
+storage_backend = create_backend()
+repos = Repositories(storage_backend)
+
+# Products are served from an in-process snapshot kept current by a listener
+catalog = CatalogSnapshot(repos.products.ref)
 
-firebase_admin.initialize_app(cred, {
-    'databaseURL': 'https://samrat-4d6b3-default-rtdb.firebaseio.com/'
-})
+# Settings, categories and metal rates are cached with write-through updates
+config_cache = ConfigCache(repos.read_node, ttl=CONFIG_CACHE_TTL)
+
+# Every rate update is appended here, with daily and weekly summaries for charts
+rate_history = RateHistory(repos)
 
 def init_firebase():
     # Check if database is already initialized
-    existing_users = db.reference('users').get()
+    existing_users = repos.users.all()
     if existing_users:
         print("Database already initialized, skipping setup...")
         return
@@ -62,42 +75,35 @@ def init_firebase():
         'password_hash': admin_hash,
         'role': 'admin'
     }
-    db.reference('users').child('admin').set(admin_data)
+    repos.users.put('admin', admin_data)
+    index_user_email('admin', admin_data['email'])
     
     # Initialize metal rates
     rates_data = {
         'gold': {'rate_per_gram': 6500.0, 'source': 'Manual', 'fetched_at': datetime.now().isoformat()},
         'silver': {'rate_per_gram': 85.0, 'source': 'Manual', 'fetched_at': datetime.now().isoformat()}
     }
-    db.reference('metal_rates').set(rates_data)
+    repos.metal_rates.set(rates_data)
     
     # Initialize settings
     settings_data = {'whatsapp_number': '919034772610'}
-    db.reference('settings').set(settings_data)
+    repos.settings.set(settings_data)
     
     print("Firebase database initialized successfully!")
 
 def get_metal_rates():
-    rates_ref = db.reference('metal_rates')
-    rates = rates_ref.get() or {}
-    return rates
-
-def convert_google_drive_url(url):
-    """Convert Google Drive share URL to direct image URL"""
-    if not url:
-        return url
-    
-    # Handle different Google Drive URL formats
-    if 'drive.google.com' in url:
-        if '/file/d/' in url:
-            # Extract file ID from sharing URL
-            file_id = url.split('/file/d/')[1].split('/')[0]
-            return f'https://lh3.googleusercontent.com/d/{file_id}'
-        elif 'id=' in url:
-            # Already in direct format, return as is
-            return url
-    
-    return url
+    return config_cache.get('metal_rates')
+
+def image_src(document):
+    """Display URL of a product or category image
+
+    Normalized documents store the Drive file id, so only older ones need
+    their link parsed.
+    """
+    file_id = document.get('image_file_id')
+    if file_id:
+        return url_for('drive_image', file_id=file_id)
+    return convert_google_drive_url(document.get('image_url', ''))
 
 def calculate_price(product, rates):
     if product['price_type'] == 'fixed':
@@ -119,30 +125,108 @@ def calculate_price(product, rates):
             return round(metal_cost + making_cost, 2)
     return product['base_price']
 
+# Prices are precomputed in one batched pass when rates or products change
+price_engine = PriceEngine(get_metal_rates)
+catalog.subscribe(price_engine.apply)
+
+def on_config_change(name, value):
+    # Rates changed here or elsewhere: recompute every price in one pass
+    if name == 'metal_rates':
+        price_engine.set_rates(value)
+
+config_cache.subscribe(on_config_change)
+
+# Open pages get new rates pushed; subscribed after the price engine so
+# streams read prices that already use the new rates
+rate_events = create_hub('rates')
+
+def publish_rates(name, value):
+    if name == 'metal_rates':
+        rates = {metal: {'rate_per_gram': data.get('rate_per_gram'), 'fetched_at': data.get('fetched_at'), 'source': data.get('source')}
+                 for metal, data in value.items() if isinstance(data, dict)}
+        rate_events.publish(version_tag(rates), {'rates': rates})
+
+config_cache.subscribe(publish_rates)
+
+# Shop search reads term postings instead of scanning every product
+search_index = SearchIndex()
+catalog.subscribe(search_index.apply)
+
+# Visibility, category, metal and purity filters are bitmap intersections
+facet_index = FacetIndex()
+catalog.subscribe(facet_index.apply)
+
+# Keyset pagination over per-sort orderings of the catalog
+paginator = Paginator(catalog, facet_index, price_engine)
+
+def product_price(product_id, product):
+    price = price_engine.price(product_id)
+    if price is None:
+        price = calculate_price(product, price_engine.rates)
+    return price
+
+# Fingerprinted static files, image variants, the Drive image proxy and the
+# service worker, with their template globals and routes (see web_assets.py)
+web_assets = WebAssets(app, lambda: page_data_version(), lambda file_id: referenced_image(file_id))
+image_pipeline = web_assets.images
+static_assets = web_assets.static
+image_proxy = web_assets.proxy
+asset_url = web_assets.asset_url
+convert_google_drive_url = web_assets.convert_google_drive_url
+
+# Drive files the products show; only these and category images go through /img/
+image_references = ImageReferences()
+catalog.subscribe(image_references.apply)
+
+def referenced_image(file_id):
+    if file_id in image_references:
+        return True
+    return any(document_file_id(category) == file_id for category in config_cache.get('categories').values()
+               if isinstance(category, dict))
+
+# Rendered public pages, keyed by route, query and the data versions below
+page_cache = ResponseCache()
+def page_data_version():
+    # Content hashes rather than change counters, so the version is the same
+    # on every instance and after a restart (prices follow from the products
+    # and rates); expired config nodes are re-read together first
+    config_cache.refresh_many(CONFIG_NODES, fetch_parallel)
+    return (catalog.digest, config_cache.digest('metal_rates'), config_cache.digest('categories'), config_cache.digest('settings'), image_pipeline.version, static_assets.version)
+
+@app.before_request
+def count_backend_calls():
+    start_call_count()
+
+@app.after_request
+def add_backend_calls_header(response):
+    response.headers['X-Backend-Calls'] = str(call_count())
+    return response
+
 @app.route('/')
+@versioned_page(page_data_version)
+@cached_page(page_cache, page_data_version)
 def home():
-    products_ref = db.reference('products')
-    all_products = products_ref.get() or {}
+    all_products = catalog.products()
     
     # Filter visible products and get latest 10
     products = []
     for key, product in all_products.items():
         if not product.get('is_hidden', False):
-            product['id'] = key
-            products.append(product)
+            products.append(dict(product, id=key))
     
     products = sorted(products, key=lambda x: x.get('name', ''), reverse=True)[:10]
-    rates = get_metal_rates()
     
-    # Calculate prices and convert Google Drive URLs
+    # Rates and categories are independent reads, fetch them together
+    config = config_cache.refresh_many(('metal_rates', 'categories'), fetch_parallel)
+    rates = config['metal_rates']
+    
+    # Look up precomputed prices and convert Google Drive URLs
     for product in products:
-        product['calculated_price'] = calculate_price(product, rates)
-        if product.get('image_url'):
-            product['image_url'] = convert_google_drive_url(product['image_url'])
+        product['calculated_price'] = product_price(product['id'], product)
+        product['image_url'] = image_src(product)
     
     # Get only specific categories
-    categories_ref = db.reference('categories')
-    categories_data = categories_ref.get() or {}
+    categories_data = config['categories']
     
     # Only show these 4 categories
     allowed_categories = ['earrings', 'chains', 'rings', 'necklaces']
@@ -153,7 +237,7 @@ def home():
             category = {
                 'id': cat_id,
                 'name': categories_data[cat_id]['name'],
-                'image_url': convert_google_drive_url(categories_data[cat_id].get('image_url', ''))
+                'image_url': image_src(categories_data[cat_id])
             }
             categories.append(category)
         else:
@@ -167,91 +251,238 @@ def home():
     
     return render_template('home.html', products=products, rates=rates, categories=categories)
 
-@app.route('/shop')
-def shop():
+def shop_query(limit=SHOP_PAGE_SIZE):
+    """Resolve the shop query string to one keyset page of product ids"""
     category = request.args.get('category', '')
     search = request.args.get('search', '')
     metal = request.args.get('metal', '')
     price_range = request.args.get('price', '')
     sort_by = request.args.get('sort', '')
     
-    products_ref = db.reference('products')
-    all_products = products_ref.get() or {}
+    # Enhanced search - name, sku, category, description
+    search_ids = search_index.search(search) if search else None
+    
+    # Price range filter runs on the precomputed price column
+    try:
+        bounds = price_bounds(price_range)
+    except ValueError:
+        bounds = None  # a malformed range from the URL just isn't applied
     
+    # Category/metal filters and every sort mode page through in-memory orderings
+    return paginator.page(sort_by, {'category': category, 'metal_type': metal}, search_ids=search_ids,
+                          price_range=bounds, cursor=request.args.get('cursor'), limit=limit)
+
+def price_bounds(price_range):
+    """(min, max) of a ?price=min-max filter, None without one; ValueError when malformed"""
+    if not price_range:
+        return None
+    low, high = map(float, price_range.split('-'))
+    return low, high
+
+def shop_page():
+    """Resolve the shop query string to one keyset page of products"""
+    all_products = catalog.products()
+    page = shop_query()
+    
+    # Convert Google Drive URLs
     products = []
-    for key, product in all_products.items():
-        if not product.get('is_hidden', False):
-            product['id'] = key
-            
-            # Enhanced search - name, sku, category, description
-            if search:
-                search_lower = search.lower()
-                searchable_text = f"{product.get('name', '')} {product.get('sku', '')} {product.get('category', '')} {product.get('description', '')}".lower()
-                if search_lower not in searchable_text:
-                    continue
-            
-            # Category filter
-            if category and product.get('category') != category:
-                continue
-            
-            # Metal filter
-            if metal and product.get('metal_type', '').lower() != metal.lower():
-                continue
-                
-            products.append(product)
+    for key in page.product_ids:
+        if key not in all_products:
+            continue
+        product = dict(all_products[key], id=key)
+        product['calculated_price'] = product_price(key, product)
+        product['image_url'] = image_src(product)
+        products.append(product)
+    
+    return products, page
+
+def page_urls(endpoint, more_endpoint, next_cursor):
+    if not next_cursor:
+        return None, None
+    args = request.args.to_dict()
+    args['cursor'] = next_cursor
+    return url_for(endpoint, **args), url_for(more_endpoint, **args)
+
+@app.route('/shop')
+@versioned_page(page_data_version)
+@cached_page(page_cache, page_data_version)
+def shop():
+    category = request.args.get('category', '')
+    search = request.args.get('search', '')
+    metal = request.args.get('metal', '')
+    price_range = request.args.get('price', '')
     
+    products, page = shop_page()
     rates = get_metal_rates()
+    next_page_url, more_url = page_urls('shop', 'shop_more', page.next_cursor)
     
-    # Calculate prices and convert Google Drive URLs
-    for product in products:
-        product['calculated_price'] = calculate_price(product, rates)
-        if product.get('image_url'):
-            product['image_url'] = convert_google_drive_url(product['image_url'])
-    
-    # Price range filter (after price calculation)
-    if price_range and '-' in price_range:
-        min_price, max_price = map(float, price_range.split('-'))
-        products = [p for p in products if min_price <= p['calculated_price'] <= max_price]
-    
-    # Sorting
-    if sort_by == 'name':
-        products.sort(key=lambda x: x.get('name', ''))
-    elif sort_by == 'price-low':
-        products.sort(key=lambda x: x['calculated_price'])
-    elif sort_by == 'price-high':
-        products.sort(key=lambda x: x['calculated_price'], reverse=True)
-    elif sort_by == 'category':
-        products.sort(key=lambda x: x.get('category', ''))
-    
-    # Get categories from Firebase
-    categories_ref = db.reference('categories')
-    categories_data = categories_ref.get() or {}
+    # Get categories from the config cache
+    categories_data = config_cache.get('categories')
     
+    category_counts = page.facet_counts.get('category', {})
     categories = []
     for cat_id, cat_data in categories_data.items():
         if not cat_data.get('is_hidden', False):
-            categories.append({'name': cat_data['name']})
+            categories.append({'name': cat_data['name'], 'count': category_counts.get(cat_data['name'], 0)})
     
-    return render_template('shop.html', products=products, rates=rates, categories=categories, current_category=category, current_search=search, current_metal=metal, current_price=price_range)
+    return render_template('shop.html', products=products, rates=rates, categories=categories, metal_counts=page.facet_counts.get('metal_type', {}), total_products=page.total, next_cursor=page.next_cursor, next_page_url=next_page_url, more_url=more_url, current_category=category, current_search=search, current_metal=metal, current_price=price_range)
+
+@app.route('/shop/more')
+def shop_more():
+    """JSON "load more" page for infinite scroll in script.js"""
+    products, page = shop_page()
+    next_page_url, more_url = page_urls('shop', 'shop_more', page.next_cursor)
+    
+    return {
+        'html': render_template('_product_cards.html', products=products),
+        'count': len(products),
+        'total': page.total,
+        'next_cursor': page.next_cursor,
+        'next_page_url': next_page_url,
+        'more_url': more_url
+    }
+
+def api_product(product_id, product):
+    """Every field /api/products can return for one product"""
+    image_url = image_src(product)
+    if not image_url and product.get('image') and product['image'] != 'default.jpg':
+        image_url = asset_url(f"images/products/{product['image']}")
+    return {
+        'id': product_id,
+        'name': product.get('name'),
+        'sku': product.get('sku'),
+        'category': product.get('category'),
+        'description': product.get('description'),
+        'metal_type': product.get('metal_type'),
+        'purity': product.get('purity'),
+        'price_type': product.get('price_type'),
+        'weight': product.get('weight'),
+        'making_charges': product.get('making_charges'),
+        'making_charges_type': product.get('making_charges_type'),
+        'price': product_price(product_id, product),
+        'image_url': image_url or None,
+        'url': url_for('product_detail', product_id=product_id)
+    }
+
+# Serialized API records; prices and hashed image URLs are baked into them.
+# Product edits only drop that product's records (the catalog subscription);
+# the whole cache goes when the rates or assets change. rates_version covers
+# the moment between the config cache storing new rates and the engine
+# repricing with them
+api_records = PayloadCache(api_product, lambda: (config_cache.digest('metal_rates'), price_engine.rates_version, static_assets.version))
+catalog.subscribe(api_records.apply)
+
+def api_response(build):
+    """Conditional GET for the catalog API; build(fields, fmt) returns the body"""
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    fmt = negotiate(request.accept_mimetypes)
+    
+    # Data versions and the query decide the body, so 304s skip building it
+    etag = version_tag((page_data_version(), request.path, normalized_args(), fmt))
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        body = build(fields, fmt)
+        if body is None:
+            return {'error': 'Product not found'}, 404
+        response = app.response_class(body, mimetype=mimetype(fmt))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
+
+@app.route('/api/products')
+def api_products():
+    """Shop filters, sorts and cursors as JSON or MessagePack"""
+    try:
+        price_bounds(request.args.get('price'))
+    except ValueError:
+        return {'error': 'price must be a min-max range, e.g. 10000-50000'}, 400
+    def build(fields, fmt):
+        limit = min(max(request.args.get('limit', SHOP_PAGE_SIZE, type=int), 1), API_MAX_LIMIT)
+        all_products = catalog.products()
+        page = shop_query(limit)
+        records = api_records.records([(key, all_products[key]) for key in page.product_ids if key in all_products], fields, fmt)
+        next_url = url_for('api_products', **dict(request.args.to_dict(), cursor=page.next_cursor)) if page.next_cursor else None
+        return list_body(records, {'total': page.total, 'next_cursor': page.next_cursor, 'next_url': next_url}, fmt)
+    return api_response(build)
+
+@app.route('/api/products/<product_id>')
+def api_product_detail(product_id):
+    def build(fields, fmt):
+        product = catalog.get(product_id)
+        if not product or product.get('is_hidden', False):
+            return None
+        return api_records.record(product_id, product, fields, fmt)
+    return api_response(build)
+
+@app.route('/api/rates/history')
+def api_rate_history():
+    """Rate series of one metal: raw records for short ranges, daily or weekly summaries beyond"""
+    metal = request.args.get('metal', 'gold')
+    if metal not in RATE_METALS:
+        return {'error': f'Unknown metal: {metal}'}, 400
+    days = min(max(request.args.get('days', RATE_CHART_DAYS, type=int), 1), RATE_HISTORY_MAX_DAYS)
+    
+    # New records come with new current rates; the window key covers the range moving on
+    now = time.time()
+    resolution = request.args.get('resolution')
+    etag = version_tag((config_cache.digest('metal_rates'), rate_history.window_key(days, resolution, now), normalized_args()))
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(rate_history.series(metal, days=days, resolution=resolution, now=now))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/events/rates')
+def rate_stream():
+    """Server-Sent Events with the current rates, and prices of ?ids= products, on every change"""
+    product_ids = [key for key in request.args.get('ids', '').split(',') if key][:SSE_MAX_PRODUCT_IDS]
+    
+    # Loads the rates on a cold start and picks up changes made by other instances
+    get_metal_rates()
+    
+    def render(data):
+        prices = {}
+        for product_id in product_ids:
+            product = catalog.get(product_id)
+            if product and not product.get('is_hidden', False):
+                prices[product_id] = product_price(product_id, product)
+        return dict(data, prices=prices)
+    
+    stream = rate_events.connect(request.headers.get('Last-Event-ID'), render)
+    if stream is None:
+        return app.response_class('Too many open streams', status=503, headers={'Retry-After': '30'})
+    response = app.response_class(stream, mimetype=SSE_MIMETYPE)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/product/<product_id>')
+@versioned_page(page_data_version)
+@cached_page(page_cache, page_data_version)
 def product_detail(product_id):
-    product_ref = db.reference(f'products/{product_id}')
-    product = product_ref.get()
+    product = catalog.get(product_id)
     
     if not product:
         return redirect(url_for('shop'))
     
-    product['id'] = product_id
-    rates = get_metal_rates()
-    product['calculated_price'] = calculate_price(product, rates)
+    product = dict(product, id=product_id)
+    
+    # Rates and settings are independent reads, fetch them together
+    config = config_cache.refresh_many(('metal_rates', 'settings'), fetch_parallel)
+    rates = config['metal_rates']
+    product['calculated_price'] = product_price(product_id, product)
     
     # Convert Google Drive URL if present
-    if product.get('image_url'):
-        product['image_url'] = convert_google_drive_url(product['image_url'])
+    product['image_url'] = image_src(product)
     
-    settings_ref = db.reference('settings')
-    settings = settings_ref.get() or {}
+    settings = config['settings']
     whatsapp_number = settings.get('whatsapp_number', '919999999999')
     
     return render_template('product_detail.html', product=product, rates=rates, whatsapp_number=whatsapp_number)
@@ -270,20 +501,19 @@ def wishlist():
         return redirect(url_for('profile'))
     
     user_mobile = session['user_mobile']
-    wishlist_ref = db.reference(f'wishlists/{user_mobile}')
-    wishlist_items = wishlist_ref.get() or {}
+    wishlist_items = repos.wishlists.items(user_mobile)
+    
+    # Resolve the whole wishlist in one step instead of a GET per item
+    wishlist_products, _ = catalog.get_many(list(wishlist_items.keys()))
     
     products = []
-    rates = get_metal_rates()
     
     for product_id in wishlist_items.keys():
-        product_ref = db.reference(f'products/{product_id}')
-        product = product_ref.get()
+        product = wishlist_products.get(product_id)
         if product and not product.get('is_hidden', False):
-            product['id'] = product_id
-            product['calculated_price'] = calculate_price(product, rates)
-            if product.get('image_url'):
-                product['image_url'] = convert_google_drive_url(product['image_url'])
+            product = dict(product, id=product_id)
+            product['calculated_price'] = product_price(product_id, product)
+            product['image_url'] = image_src(product)
             products.append(product)
     
     return render_template('wishlist.html', products=products)
@@ -294,8 +524,7 @@ def add_to_wishlist(product_id):
         return {'success': False, 'message': 'Please login first'}
     
     user_mobile = session['user_mobile']
-    wishlist_ref = db.reference(f'wishlists/{user_mobile}/{product_id}')
-    wishlist_ref.set({'added_at': datetime.now().isoformat()})
+    repos.wishlists.add(user_mobile, product_id, {'added_at': datetime.now().isoformat()})
     
     return {'success': True}
 
@@ -305,8 +534,7 @@ def remove_from_wishlist(product_id):
         return {'success': False, 'message': 'Please login first'}
     
     user_mobile = session['user_mobile']
-    wishlist_ref = db.reference(f'wishlists/{user_mobile}/{product_id}')
-    wishlist_ref.delete()
+    repos.wishlists.remove(user_mobile, product_id)
     
     return {'success': True}
 
@@ -316,8 +544,7 @@ def check_wishlist(product_id):
         return {'in_wishlist': False}
     
     user_mobile = session['user_mobile']
-    wishlist_ref = db.reference(f'wishlists/{user_mobile}/{product_id}')
-    exists = wishlist_ref.get() is not None
+    exists = repos.wishlists.contains(user_mobile, product_id)
     
     return {'in_wishlist': exists}
 
@@ -325,15 +552,47 @@ def check_wishlist(product_id):
 def profile():
     return render_template('profile.html')
 
+def get_customer(mobile):
+    """Customers are keyed by mobile number, so this is one keyed read"""
+    if not is_valid_key(mobile):
+        return None
+    return repos.customers.get(mobile)
+
+def migrate_customer_keys():
+    """Re-key legacy customer records under customers/{mobile} (runs once)"""
+    if repos.meta.get('customers_keyed_by_mobile'):
+        return
+    
+    customers = repos.customers.all()
+    updates = {}
+    migrated = 0
+    skipped = 0
+    for uid, customer in customers.items():
+        mobile = str(customer.get('mobile') or '')
+        if not mobile or uid == mobile:
+            continue
+        # A mobile that can't be a key would fail the whole update; leave the record as it is
+        if not is_valid_key(mobile):
+            skipped += 1
+            continue
+        # Keep a record already stored under the mobile key, it is the newer one
+        if mobile not in customers:
+            updates[f'customers/{mobile}'] = customer
+        updates[f'customers/{uid}'] = None
+        migrated += 1
+    
+    updates['meta/customers_keyed_by_mobile'] = True
+    repos.update_paths(updates)
+    print(f"Migrated {migrated} legacy customer records")
+    if skipped:
+        print(f"Skipped {skipped} customer records whose mobile can't be used as a key")
+
 @app.route('/check-user', methods=['POST'])
 def check_user():
     data = request.get_json()
     mobile = data.get('mobile')
     
-    users_ref = db.reference('customers')
-    users = users_ref.get() or {}
-    
-    exists = any(user.get('mobile') == mobile for user in users.values())
+    exists = get_customer(mobile) is not None
     return {'exists': exists}
 
 @app.route('/user-login', methods=['POST'])
@@ -341,17 +600,8 @@ def user_login():
     mobile = request.form['mobile']
     name = request.form.get('name', '')
     
-    users_ref = db.reference('customers')
-    users = users_ref.get() or {}
-    
     # Find existing user
-    user = None
-    user_id = None
-    for uid, user_data in users.items():
-        if user_data.get('mobile') == mobile:
-            user = user_data
-            user_id = uid
-            break
+    user = get_customer(mobile)
     
     if user:
         # Login existing user
@@ -374,7 +624,7 @@ def user_login():
             'registered_at': datetime.now().isoformat()
         }
         
-        users_ref.child(user_id).set(user_data)
+        repos.customers.put(user_id, user_data)
 
         session.permanent = True
         session['user_mobile'] = mobile
@@ -390,21 +640,77 @@ def logout():
     flash('Logged out successfully', 'success')
     return redirect(url_for('home'))
 
+# email key -> user id, mirrors user_emails/ in Firebase
+user_email_index = {}
+
+def email_key(email):
+    """Emails as Firebase keys: '.' becomes ',' and the other characters keys can't hold are %-escaped"""
+    key = email.strip().lower().replace('%', '%25').replace('.', ',')
+    for c in '$#[]/':
+        key = key.replace(c, f'%{ord(c):02X}')
+    return key
+
+def index_user_email(user_id, email):
+    """Maintain the email -> user id index, call whenever a user is created"""
+    key = email_key(email)
+    repos.user_emails.put(key, user_id)
+    user_email_index[key] = user_id
+
+def index_user_emails():
+    """Build user_emails/ from the users tree for existing data (runs once)"""
+    if repos.meta.get('user_emails_indexed'):
+        return
+    
+    users = repos.users.all()
+    updates = {f'user_emails/{email_key(user["email"])}': uid for uid, user in users.items() if user.get('email')}
+    updates['meta/user_emails_indexed'] = True
+    repos.update_paths(updates)
+
+def find_admin(email):
+    """Resolve an admin by email with keyed reads
+
+    Only the user id is remembered: the record itself is read on every login
+    so a changed password or revoked role takes effect at once. Emails the
+    index doesn't know are looked up with a query on users/ and indexed.
+    """
+    key = email_key(email)
+    user_id = user_email_index.get(key) or repos.user_emails.get(key)
+    user = repos.users.get(user_id) if user_id else None
+    if not user or email_key(user.get('email', '')) != key:
+        # Admins added or re-emailed in the Firebase console aren't in the
+        # index yet, and an entry may point at a user whose email changed
+        user_email_index.pop(key, None)
+        stale = user_id is not None
+        user_id, user = find_user_by_email(email)
+        if user is None:
+            if stale:
+                repos.user_emails.delete(key)
+            return None
+        index_user_email(user_id, email)
+    user_email_index[key] = user_id
+    
+    if user.get('role') != 'admin':
+        return None
+    
+    user['id'] = user_id
+    return user
+
+def find_user_by_email(email):
+    """(user id, user) of the user with email, by a query on the users node, else (None, None)"""
+    key = email_key(email)
+    for candidate in dict.fromkeys((email, email.strip(), email.strip().lower())):
+        for user_id, user in repos.users.find('email', candidate).items():
+            if email_key(user.get('email', '')) == key:
+                return user_id, user
+    return None, None
+
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
         
-        users_ref = db.reference('users')
-        users = users_ref.get() or {}
-        
-        user = None
-        for key, user_data in users.items():
-            if user_data.get('email') == email and user_data.get('role') == 'admin':
-                user = user_data
-                user['id'] = key
-                break
+        user = find_admin(email)
         
         if user and check_password_hash(user['password_hash'], password):
             session.permanent = True
@@ -422,14 +728,12 @@ def admin_dashboard():
     if 'user_id' not in session:
         return redirect(url_for('admin_login'))
     
-    products_ref = db.reference('products')
-    all_products = products_ref.get() or {}
+    all_products = catalog.products()
     
     product_count = len(all_products)
     recent_products = []
     for key, product in list(all_products.items())[-5:]:
-        product['sku'] = key
-        recent_products.append(product)
+        recent_products.append(dict(product, sku=key))
     
     rates = get_metal_rates()
     
@@ -445,18 +749,21 @@ def admin_products():
     if 'user_id' not in session:
         return redirect(url_for('admin_login'))
     
-    products_ref = db.reference('products')
-    all_products = products_ref.get() or {}
+    all_products = catalog.products()
+    page = paginator.page(cursor=request.args.get('cursor'), limit=ADMIN_PAGE_SIZE, include_hidden=True)
     
     products = []
-    for key, product in all_products.items():
-        product['id'] = key
+    for key in page.product_ids:
+        if key not in all_products:
+            continue
+        product = dict(all_products[key], id=key)
         # Convert Google Drive URLs
-        if product.get('image_url'):
-            product['image_url'] = convert_google_drive_url(product['image_url'])
+        product['image_url'] = image_src(product)
         products.append(product)
     
-    return render_template('admin/products.html', products=products)
+    next_page_url = url_for('admin_products', cursor=page.next_cursor) if page.next_cursor else None
+    
+    return render_template('admin/products.html', products=products, total_products=page.total, next_page_url=next_page_url)
 
 @app.route('/admin/products/add', methods=['GET', 'POST'])
 def admin_add_product():
@@ -464,7 +771,7 @@ def admin_add_product():
         return redirect(url_for('admin_login'))
     
     if request.method == 'POST':
-        weight_value = float(request.form.get('weight', 0))
+        weight_value = request.form.get('weight', 0)
         product_data = {
             'name': request.form['name'],
             'sku': request.form['sku'],
@@ -472,16 +779,22 @@ def admin_add_product():
             'description': request.form['description'],
             'price_type': request.form['price_type'],
             'weight_in_grams': weight_value,
-            'base_price': float(request.form.get('base_price', 0)),
+            'base_price': request.form.get('base_price', 0),
             'metal_type': request.form['metal_type'],
             'purity': request.form['purity'],
             'image_url': request.form.get('image_url', ''),
             'weight': weight_value,
-            'making_charges': float(request.form.get('making_charges', 0)),
+            'making_charges': request.form.get('making_charges', 0),
             'making_charges_type': request.form.get('making_charges_type', 'rupees'),
             'is_hidden': bool(request.form.get('is_hidden'))
         }
         
+        errors = product_errors(product_data)
+        if errors:
+            for error in errors:
+                flash(error, 'error')
+            return redirect(url_for('admin_add_product'))
+        
         # Handle image upload
         image = 'default.jpg'
         if 'image' in request.files:
@@ -489,28 +802,24 @@ def admin_add_product():
             if file and file.filename:
                 filename = secure_filename(file.filename)
                 file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+                image_pipeline.submit(f'images/products/{filename}')
                 image = filename
         
         product_data['image'] = image
+        product_data = normalize_product(product_data)
         
-        # Check if SKU exists
-        products_ref = db.reference('products')
-        all_products = products_ref.get() or {}
-        
-        sku_exists = any(p.get('sku') == product_data['sku'] for p in all_products.values())
-        
-        if sku_exists:
+        # Products are keyed by SKU, so the local snapshot answers most
+        # duplicates and a transaction on products/{sku} settles the rest
+        if product_data['sku'] in catalog or not repos.products.create(product_data['sku'], product_data):
             flash('SKU already exists!', 'error')
         else:
-            # Use SKU as key
-            products_ref.child(product_data['sku']).set(product_data)
+            catalog.put(product_data['sku'], product_data)
             flash('Product added successfully!', 'success')
         
         return redirect(url_for('admin_products'))
     
-    # Get categories from Firebase
-    categories_ref = db.reference('categories')
-    categories_data = categories_ref.get() or {}
+    # Get categories from the config cache
+    categories_data = config_cache.get('categories')
     categories = [{'id': k, 'name': v['name']} for k, v in categories_data.items() if not v.get('is_hidden', False)]
     
     return render_template('admin/add_product.html', categories=categories)
@@ -520,19 +829,14 @@ def admin_edit_product(product_id):
     if 'user_id' not in session:
         return redirect(url_for('admin_login'))
     
-    product_ref = db.reference(f'products/{product_id}')
-    product = product_ref.get()
+    product = repos.products.get(product_id)
     
     if not product:
         flash('Product not found!', 'error')
         return redirect(url_for('admin_products'))
         
-    # Convert Google Drive URL for display
-    if product.get('image_url'):
-        product['image_url'] = convert_google_drive_url(product['image_url'])
-        
     if request.method == 'POST':
-        weight_value = float(request.form.get('weight', 0))
+        weight_value = request.form.get('weight', 0)
         product_data = {
             'name': request.form['name'],
             'sku': request.form['sku'],
@@ -540,16 +844,22 @@ def admin_edit_product(product_id):
             'description': request.form['description'],
             'price_type': request.form['price_type'],
             'weight_in_grams': weight_value,
-            'base_price': float(request.form.get('base_price', 0)),
+            'base_price': request.form.get('base_price', 0),
             'metal_type': request.form['metal_type'],
             'purity': request.form['purity'],
             'image_url': request.form.get('image_url', ''),
             'weight': weight_value,
-            'making_charges': float(request.form.get('making_charges', 0)),
+            'making_charges': request.form.get('making_charges', 0),
             'making_charges_type': request.form.get('making_charges_type', 'rupees'),
             'is_hidden': bool(request.form.get('is_hidden'))
         }
         
+        errors = product_errors(product_data)
+        if errors:
+            for error in errors:
+                flash(error, 'error')
+            return redirect(url_for('admin_edit_product', product_id=product_id))
+        
         # Handle image upload
         image = product.get('image', 'default.jpg')
         if 'image' in request.files:
@@ -557,18 +867,20 @@ def admin_edit_product(product_id):
             if file and file.filename:
                 filename = secure_filename(file.filename)
                 file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+                image_pipeline.submit(f'images/products/{filename}')
                 image = filename
         
         product_data['image'] = image
+        product_data = normalize_product(dict(product, **product_data))
         
         # Update product
-        product_ref.update(product_data)
+        repos.products.put(product_id, product_data)
+        catalog.put(product_id, product_data)
         flash('Product updated successfully!', 'success')
         return redirect(url_for('admin_products'))
 
-    # Get categories from Firebase
-    categories_ref = db.reference('categories')
-    categories_data = categories_ref.get() or {}
+    # Get categories from the config cache
+    categories_data = config_cache.get('categories')
     categories = [{'id': k, 'name': v['name']} for k, v in categories_data.items() if not v.get('is_hidden', False)]
     
     product['id'] = product_id
@@ -579,8 +891,8 @@ def admin_delete_product(product_id):
     if 'user_id' not in session:
         return redirect(url_for('admin_login'))
     
-    product_ref = db.reference(f'products/{product_id}')
-    product_ref.delete()
+    repos.products.delete(product_id)
+    catalog.delete(product_id)
     
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('admin_products'))
@@ -591,7 +903,11 @@ def admin_rates():
         return redirect(url_for('admin_login'))
     
     rates = get_metal_rates()
-    return render_template('admin/rates.html', rates=rates)
+    
+    # A year of daily summaries per metal: one or two reads each
+    charts = {metal: chart_geometry(rate_history.series(metal, days=RATE_CHART_DAYS)['points'])
+              for metal in RATE_METALS}
+    return render_template('admin/rates.html', rates=rates, charts=charts, chart_days=RATE_CHART_DAYS)
 
 @app.route('/admin/rates/update', methods=['POST'])
 def admin_update_rates():
@@ -601,11 +917,11 @@ def admin_update_rates():
     gold_rate = float(request.form['gold_rate'])
     silver_rate = float(request.form['silver_rate'])
     
-    rates_ref = db.reference('metal_rates')
-    current_time = datetime.now().isoformat()
+    updated_at = time.time()
+    current_time = datetime.fromtimestamp(updated_at).isoformat()
     
     # Update rates with proper structure
-    rates_ref.set({
+    rates_data = {
         'gold': {
             'rate_per_gram': gold_rate,
             'fetched_at': current_time,
@@ -616,7 +932,13 @@ def admin_update_rates():
             'fetched_at': current_time,
             'source': 'Manual'
         }
-    })
+    }
+    # The current rates and their history records are written together
+    repos.update_paths(dict(rate_history.entries(rates_data, updated_at), metal_rates=rates_data))
+    rate_history.summarize(rates_data, updated_at)
+    
+    # Refresh the cache in place, which recomputes every product price in one pass
+    config_cache.set('metal_rates', rates_data)
     
     flash('Metal rates updated successfully!', 'success')
     return redirect(url_for('admin_rates'))
@@ -626,8 +948,7 @@ def admin_settings():
     if 'user_id' not in session:
         return redirect(url_for('admin_login'))
     
-    settings_ref = db.reference('settings')
-    settings = settings_ref.get() or {}
+    settings = config_cache.get('settings')
     
     return render_template('admin/settings.html', settings=settings)
 
@@ -638,19 +959,25 @@ def admin_update_settings():
     
     whatsapp_number = request.form['whatsapp_number']
     
-    settings_ref = db.reference('settings')
-    settings_ref.update({'whatsapp_number': whatsapp_number})
+    repos.settings.update({'whatsapp_number': whatsapp_number})
+    config_cache.update('settings', {'whatsapp_number': whatsapp_number})
     
     flash('Settings updated successfully!', 'success')
     return redirect(url_for('admin_settings'))
 
+@app.route('/admin/cache-stats')
+def admin_cache_stats():
+    if 'user_id' not in session:
+        return {'success': False}, 401
+    
+    return {'success': True, 'page_cache': page_cache.stats(), 'api_records': api_records.stats(), 'rate_events': rate_events.stats()}
+
 @app.route('/admin/users')
 def admin_users():
     if 'user_id' not in session:
         return redirect(url_for('admin_login'))
     
-    users_ref = db.reference('customers')
-    users = users_ref.get() or {}
+    users = repos.customers.all()
     
     return render_template('admin/users.html', users=users)
 
@@ -659,8 +986,7 @@ def admin_categories():
     if 'user_id' not in session:
         return redirect(url_for('admin_login'))
     
-    categories_ref = db.reference('categories')
-    categories_data = categories_ref.get() or {}
+    categories_data = config_cache.get('categories')
     
     # Default categories if none exist
     if not categories_data:
@@ -672,8 +998,9 @@ def admin_categories():
             'pendants': {'name': 'Pendants', 'is_hidden': False},
             'chains': {'name': 'Chains', 'is_hidden': False}
         }
-        categories_ref.set(default_categories)
+        repos.categories.replace_all(default_categories)
         categories_data = default_categories
+        config_cache.set('categories', default_categories)
     
     # Convert to list format
     categories = []
@@ -682,7 +1009,7 @@ def admin_categories():
             'id': cat_id,
             'name': cat_data['name'],
             'is_hidden': cat_data.get('is_hidden', False),
-            'image_url': convert_google_drive_url(cat_data.get('image_url', '')),
+            'image_url': image_src(cat_data),
             'product_count': 0
         }
         categories.append(category)
@@ -694,12 +1021,12 @@ def admin_toggle_category(category_id):
     if 'user_id' not in session:
         return {'success': False}, 401
     
-    category_ref = db.reference(f'categories/{category_id}')
-    category = category_ref.get()
+    category = repos.categories.get(category_id)
     
     if category:
         new_status = not category.get('is_hidden', False)
-        category_ref.update({'is_hidden': new_status})
+        repos.categories.update(category_id, {'is_hidden': new_status})
+        config_cache.update_child('categories', category_id, {'is_hidden': new_status})
         return {'success': True}
     
     return {'success': False}
@@ -717,12 +1044,12 @@ def admin_add_category():
         return {'success': False, 'message': 'Category name is required'}
     
     category_id = name.lower().replace(' ', '_')
-    category_ref = db.reference(f'categories/{category_id}')
-    
-    if category_ref.get():
+    if repos.categories.get(category_id):
         return {'success': False, 'message': 'Category already exists'}
     
-    category_ref.set({'name': name, 'is_hidden': False, 'image_url': image_url})
+    category_data = normalize_category({'name': name, 'is_hidden': False, 'image_url': image_url})
+    repos.categories.put(category_id, category_data)
+    config_cache.set_child('categories', category_id, category_data)
     return {'success': True}
 
 @app.route('/admin/categories/edit/<category_id>', methods=['POST'])
@@ -737,8 +1064,10 @@ def admin_edit_category(category_id):
     if not name:
         return {'success': False, 'message': 'Category name is required'}
     
-    category_ref = db.reference(f'categories/{category_id}')
-    category_ref.update({'name': name, 'image_url': image_url})
+    category = repos.categories.get(category_id) or {}
+    category_data = normalize_category(dict(category, name=name, image_url=image_url))
+    repos.categories.put(category_id, category_data)
+    config_cache.set_child('categories', category_id, category_data)
     return {'success': True}
 
 @app.route('/admin/categories/delete/<category_id>', methods=['POST'])
@@ -746,8 +1075,8 @@ def admin_delete_category(category_id):
     if 'user_id' not in session:
         return {'success': False}, 401
     
-    category_ref = db.reference(f'categories/{category_id}')
-    category_ref.delete()
+    repos.categories.delete(category_id)
+    config_cache.set_child('categories', category_id, None)
     return {'success': True}
 
 @app.route('/admin/products/toggle/<product_id>', methods=['POST'])
@@ -755,17 +1084,31 @@ def admin_toggle_product(product_id):
     if 'user_id' not in session:
         return {'success': False}, 401
     
-    product_ref = db.reference(f'products/{product_id}')
-    product = product_ref.get()
+    product = repos.products.get(product_id)
     
     if product:
         new_status = not product.get('is_hidden', False)
-        product_ref.update({'is_hidden': new_status})
+        repos.products.update(product_id, {'is_hidden': new_status})
+        catalog.update(product_id, {'is_hidden': new_status})
         return {'success': True}
     
     return {'success': False}
 
+def warm_caches():
+    """Load the catalog snapshot and config nodes concurrently before serving"""
+    calls = {'products': catalog.products}
+    calls.update({name: (lambda name=name: config_cache.get(name)) for name in CONFIG_NODES})
+    fetch_parallel(calls, timeout=30)
+
 if __name__ == '__main__':
     init_firebase()
+    migrate_customer_keys()
+    index_user_emails()
+    warm_caches()
     port = int(os.environ.get('PORT', 10000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    if monkey:
+        from gevent.pywsgi import WSGIServer
+        print(f"✓ Serving on gevent at port {port}")
+        WSGIServer(('0.0.0.0', port), app).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
@@ -1,16 +1,43 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import os
+import queue
 from datetime import datetime
+from markupsafe import Markup, escape
+from search_index import tokenize
+from response_cache import versioned_page
+from web_assets import WebAssets
+from image_proxy import drive_file_id
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'
 app.config['UPLOAD_FOLDER'] = 'static/images/products'
 
+DB_PATH = 'samrat_jewellers.db'
+
+# Fingerprinted static files, image variants, the Drive image proxy and the
+# service worker, with their template globals and routes (see web_assets.py)
+web_assets = WebAssets(app, lambda: page_data_version(), lambda file_id: referenced_image(file_id))
+image_pipeline = web_assets.images
+static_assets = web_assets.static
+image_proxy = web_assets.proxy
+asset_url = web_assets.asset_url
+convert_google_drive_url = web_assets.convert_google_drive_url
+
+# Applied to every new connection; WAL lets readers run while an admin writes
+DB_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY'
+)
+
 def init_db():
-    conn = sqlite3.connect('samrat_jewellers.db')
+    conn = get_db()
     c = conn.cursor()
     
     c.execute('''CREATE TABLE IF NOT EXISTS users (
@@ -37,9 +64,33 @@ def init_db():
         weight REAL DEFAULT 0,
         making_charges REAL DEFAULT 0,
         making_charges_type TEXT DEFAULT 'rupees',
-        is_hidden INTEGER DEFAULT 0
+        is_hidden INTEGER DEFAULT 0,
+        calculated_price REAL DEFAULT 0
     )''')
     
+    # Databases created before calculated_price existed get the column added
+    columns = [row['name'] for row in c.execute('PRAGMA table_info(products)')]
+    if 'calculated_price' not in columns:
+        c.execute('ALTER TABLE products ADD COLUMN calculated_price REAL DEFAULT 0')
+    
+    # Listing indexes: newest visible first, by category, by metal (matched
+    # case-insensitively) and by stored price
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_visible ON products (is_hidden, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_category ON products (category, is_hidden, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_metal ON products (lower(metal_type), is_hidden, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_products_price ON products (is_hidden, calculated_price, id)')
+    
+    # Reprice a product whenever it is added or its pricing fields change
+    c.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS products_price_insert AFTER INSERT ON products BEGIN
+            UPDATE products SET calculated_price = ({PRICE_SELECT}) WHERE id = new.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_price_update AFTER UPDATE OF
+            price_type, base_price, metal_type, weight, making_charges, making_charges_type ON products BEGIN
+            UPDATE products SET calculated_price = ({PRICE_SELECT}) WHERE id = new.id;
+        END;
+    ''')
+    
     c.execute('''CREATE TABLE IF NOT EXISTS metal_rates (
         id INTEGER PRIMARY KEY,
         metal TEXT UNIQUE NOT NULL,
@@ -54,6 +105,9 @@ def init_db():
         setting_value TEXT
     )''')
     
+    init_search(conn)
+    init_data_version(conn)
+    
     # Insert admin user
     admin_hash = generate_password_hash('admin123')
     c.execute('INSERT OR IGNORE INTO users (name, email, password_hash, role) VALUES (?, ?, ?, ?)',
@@ -79,105 +133,242 @@ def init_db():
     for product in products:
         c.execute('INSERT OR IGNORE INTO products (name, sku, category, description, price_type, weight_in_grams, base_price, metal_type, purity, image, image_url, weight, making_charges, making_charges_type, is_hidden) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', product)
     
+    refresh_prices(conn)
     conn.commit()
-    conn.close()
+
+DB_POOL_SIZE = 8
+_db_pool = queue.Queue(maxsize=DB_POOL_SIZE)
+
+def open_db():
+    conn = sqlite3.connect(DB_PATH, cached_statements=256, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+    return conn
 
 def get_db():
-    return sqlite3.connect('samrat_jewellers.db')
+    """The app context's connection, taken from a small pool of open ones
+
+    The dev server starts a thread per request, so connections are pooled
+    rather than per thread: the PRAGMAs run once per connection and
+    sqlite3's per-connection cache of prepared statements stays warm.
+    """
+    if 'db' not in g:
+        try:
+            g.db = _db_pool.get_nowait()
+        except queue.Empty:
+            g.db = open_db()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+    # A request that failed mid-write must not hand a locked connection on
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _db_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+# Column weights for bm25(): name, sku, category, description
+SEARCH_WEIGHTS = (10.0, 8.0, 4.0, 1.0)
+# Control characters can't come from the catalog, so they mark snippet highlights
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+search_ready = False
+
+def init_search(conn):
+    """Create the products_fts index and the triggers that keep it in sync"""
+    global search_ready
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone()
+    conn.executescript('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, sku, category, description,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts(rowid, name, sku, category, description)
+            VALUES (new.id, new.name, new.sku, new.category, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, sku, category, description)
+            VALUES ('delete', old.id, old.name, old.sku, old.category, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, sku, category, description ON products BEGIN
+            INSERT INTO products_fts(products_fts, rowid, name, sku, category, description)
+            VALUES ('delete', old.id, old.name, old.sku, old.category, old.description);
+            INSERT INTO products_fts(rowid, name, sku, category, description)
+            VALUES (new.id, new.name, new.sku, new.category, new.description);
+        END;
+    ''')
+    if not exists:
+        # Index the products that were there before the table existed
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    conn.commit()
+    search_ready = True
+
+version_ready = False
+
+def init_data_version(conn):
+    """Create the data_version counter and the triggers that bump it"""
+    global version_ready
+    conn.execute('''CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )''')
+    conn.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+    # Any write that can change a public page moves the version on
+    for table in ('products', 'metal_rates', 'settings'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                UPDATE data_version SET version = version + 1;
+            END''')
+    conn.commit()
+    version_ready = True
+
+def page_data_version():
+    """Version of everything public pages render, for the service worker"""
+    conn = get_db()
+    if not version_ready:
+        init_data_version(conn)
+    version = conn.execute('SELECT version FROM data_version').fetchone()['version']
+    return (version, image_pipeline.version, static_assets.version)
+
+def referenced_image(file_id):
+    """True when a product links the Drive file, so /img/ only serves shop images"""
+    rows = get_db().execute("SELECT image_url FROM products WHERE instr(image_url, ?) > 0", (file_id,)).fetchall()
+    return any(drive_file_id(row['image_url']) == file_id for row in rows)
+
+def search_query(search):
+    """FTS5 MATCH expression: every term must match, each as a prefix"""
+    return ' '.join(f'"{term}"*' for term in tokenize(search))
+
+def search_snippet(snippet):
+    """Escape an FTS5 snippet and turn its markers into <mark> tags"""
+    if not snippet or SNIPPET_START not in snippet:
+        return None
+    html = str(escape(snippet)).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+    return Markup(html)
 
 def get_metal_rates():
     conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT * FROM metal_rates')
-    rates = c.fetchall()
-    conn.close()
+    c.execute('SELECT metal, rate_per_gram, source, fetched_at FROM metal_rates')
     
     rate_dict = {}
-    for rate in rates:
-        rate_dict[rate[1]] = {
-            'rate_per_gram': rate[2],
-            'source': rate[3],
-            'fetched_at': rate[4]
+    for rate in c.fetchall():
+        rate_dict[rate['metal']] = {
+            'rate_per_gram': rate['rate_per_gram'],
+            'source': rate['source'],
+            'fetched_at': rate['fetched_at']
         }
     return rate_dict
 
-def calculate_price(product, rates):
-    if product[5] == 'fixed':
-        base_price = product[7]
-        if product[14] == 'percent':
-            making_cost = base_price * (product[13] / 100)
-        else:
-            making_cost = product[13]
-        return round(base_price + making_cost, 2)
-    elif product[5] == 'per_gram':
-        metal = product[8]
-        if metal in rates:
-            base_rate = rates[metal]['rate_per_gram']
-            metal_cost = base_rate * product[12]  # rate * weight
-            if product[14] == 'percent':
-                making_cost = metal_cost * (product[13] / 100)
-            else:
-                making_cost = product[13]
-            return round(metal_cost + making_cost, 2)
-    return product[7]
+# calculate_price() as SQL, stored in products.calculated_price so listings
+# can sort and filter by price through idx_products_price
+PRICE_SQL = """
+    CASE
+        WHEN price_type = 'fixed' THEN ROUND(base_price + CASE WHEN making_charges_type = 'percent'
+            THEN base_price * making_charges / 100 ELSE making_charges END, 2)
+        WHEN price_type = 'per_gram' AND rate.rate_per_gram IS NOT NULL THEN ROUND(
+            rate.rate_per_gram * weight + CASE WHEN making_charges_type = 'percent'
+            THEN rate.rate_per_gram * weight * making_charges / 100 ELSE making_charges END, 2)
+        ELSE base_price
+    END
+"""
+PRICE_SELECT = f'SELECT {PRICE_SQL} FROM (SELECT 1) LEFT JOIN metal_rates rate ON rate.metal = products.metal_type'
+
+def refresh_prices(conn, where='1', params=()):
+    """Recompute calculated_price for the matching products in one UPDATE"""
+    conn.execute(f'UPDATE products SET calculated_price = ({PRICE_SELECT}) WHERE {where}', params)
+
+def product_dict(row):
+    """Template-ready dict for a products row"""
+    product = dict(row)
+    product['search_snippet'] = search_snippet(product.get('search_snippet'))
+    product['image_url'] = convert_google_drive_url(product.get('image_url'))
+    return product
 
 @app.route('/')
+@versioned_page(page_data_version)
 def home():
     conn = get_db()
     c = conn.cursor()
     c.execute('SELECT * FROM products WHERE is_hidden = 0 ORDER BY id DESC LIMIT 10')
-    products = c.fetchall()
-    conn.close()
+    product_list = [product_dict(row) for row in c.fetchall()]
     
     rates = get_metal_rates()
     
-    # Calculate prices
-    product_list = []
-    for product in products:
-        product_dict = {
-            'id': product[0], 'name': product[1], 'sku': product[2], 'category': product[3],
-            'description': product[4], 'price_type': product[5], 'weight_in_grams': product[6],
-            'base_price': product[7], 'metal_type': product[8], 'purity': product[9], 'image': product[10], 
-            'image_url': product[11], 'weight': product[12], 'making_charges': product[13],
-            'making_charges_type': product[14], 'calculated_price': calculate_price(product, rates)
-        }
-        product_list.append(product_dict)
-    
     return render_template('home.html', products=product_list, rates=rates)
 
+# ORDER BY for each shop sort mode; price sorts read idx_products_price
+SHOP_SORTS = {
+    'price-low': 'calculated_price, id',
+    'price-high': 'calculated_price DESC, id',
+    'name': 'name, id',
+    'category': 'category, id'
+}
+
 @app.route('/shop')
+@versioned_page(page_data_version)
 def shop():
     category = request.args.get('category', '')
     search = request.args.get('search', '')
+    metal = request.args.get('metal', '')
+    price_range = request.args.get('price', '')
+    sort_by = request.args.get('sort', '')
     conn = get_db()
     c = conn.cursor()
     
+    conditions = ['p.is_hidden = 0']
+    params = []
+    if category:
+        conditions.append('p.category = ?')
+        params.append(category)
+    if metal:
+        conditions.append('lower(p.metal_type) = ?')
+        params.append(metal.lower())
+    if price_range and '-' in price_range:
+        try:
+            min_price, max_price = map(float, price_range.split('-'))
+        except ValueError:
+            pass  # a malformed range from the URL just isn't applied
+        else:
+            conditions.append('p.calculated_price BETWEEN ? AND ?')
+            params.extend([min_price, max_price])
+    where = ' AND '.join(conditions)
+    order = ', '.join(f'p.{term}' for term in SHOP_SORTS.get(sort_by, 'id').split(', '))
+    
+    products = []
     if search:
-        c.execute('SELECT * FROM products WHERE name LIKE ? AND is_hidden = 0', (f'%{search}%',))
-    elif category:
-        c.execute('SELECT * FROM products WHERE category = ? AND is_hidden = 0', (category,))
+        if not search_ready:
+            init_search(conn)
+        query = search_query(search)
+        if query:
+            # Best bm25 match first unless a sort was picked; the snippet comes from the description
+            if sort_by not in SHOP_SORTS:
+                order = f"bm25(products_fts, {', '.join(map(str, SEARCH_WEIGHTS))})"
+            c.execute(f'''SELECT p.*, snippet(products_fts, 3, ?, ?, '…', 12) AS search_snippet
+                          FROM products_fts JOIN products p ON p.id = products_fts.rowid
+                          WHERE products_fts MATCH ? AND {where}
+                          ORDER BY {order}''',
+                      [SNIPPET_START, SNIPPET_END, query] + params)
+            products = c.fetchall()
     else:
-        c.execute('SELECT * FROM products WHERE is_hidden = 0')
-    
-    products = c.fetchall()
-    conn.close()
+        c.execute(f'SELECT * FROM products p WHERE {where} ORDER BY {order}', params)
+        products = c.fetchall()
     
     rates = get_metal_rates()
+    product_list = [product_dict(row) for row in products]
     
-    product_list = []
-    for product in products:
-        product_dict = {
-            'id': product[0], 'name': product[1], 'sku': product[2], 'category': product[3],
-            'description': product[4], 'price_type': product[5], 'weight_in_grams': product[6],
-            'base_price': product[7], 'metal_type': product[8], 'purity': product[9], 'image': product[10],
-            'image_url': product[11], 'weight': product[12], 'making_charges': product[13],
-            'making_charges_type': product[14], 'calculated_price': calculate_price(product, rates)
-        }
-        product_list.append(product_dict)
-    
-    return render_template('shop.html', products=product_list, rates=rates, current_category=category)
+    return render_template('shop.html', products=product_list, rates=rates, current_category=category, current_search=search, current_metal=metal, current_price=price_range)
 
 @app.route('/product/<int:product_id>')
+@versioned_page(page_data_version)
 def product_detail(product_id):
     conn = get_db()
     c = conn.cursor()
@@ -185,24 +376,15 @@ def product_detail(product_id):
     product = c.fetchone()
     c.execute('SELECT setting_value FROM settings WHERE setting_key = ?', ('whatsapp_number',))
     whatsapp = c.fetchone()
-    conn.close()
     
     if not product:
         return redirect(url_for('shop'))
     
     rates = get_metal_rates()
     
-    product_dict = {
-        'id': product[0], 'name': product[1], 'sku': product[2], 'category': product[3],
-        'description': product[4], 'price_type': product[5], 'weight_in_grams': product[6],
-        'base_price': product[7], 'metal_type': product[8], 'purity': product[9], 'image': product[10],
-        'image_url': product[11], 'weight': product[12], 'making_charges': product[13],
-        'making_charges_type': product[14], 'calculated_price': calculate_price(product, rates)
-    }
-    
-    whatsapp_number = whatsapp[0] if whatsapp else '919999999999'
+    whatsapp_number = whatsapp['setting_value'] if whatsapp else '919999999999'
     
-    return render_template('product_detail.html', product=product_dict, rates=rates, whatsapp_number=whatsapp_number)
+    return render_template('product_detail.html', product=product_dict(product), rates=rates, whatsapp_number=whatsapp_number)
 
 @app.route('/about')
 def about():
@@ -230,11 +412,10 @@ def admin_login():
         c = conn.cursor()
         c.execute('SELECT * FROM users WHERE email = ? AND role = ?', (email, 'admin'))
         user = c.fetchone()
-        conn.close()
         
-        if user and check_password_hash(user[3], password):
-            session['user_id'] = user[0]
-            session['user_name'] = user[1]
+        if user and check_password_hash(user['password_hash'], password):
+            session['user_id'] = user['id']
+            session['user_name'] = user['name']
             return redirect(url_for('admin_dashboard'))
         else:
             flash('Invalid credentials', 'error')
@@ -253,7 +434,6 @@ def admin_dashboard():
     product_count = c.fetchone()[0]
     c.execute('SELECT * FROM products ORDER BY id DESC LIMIT 5')
     recent_products = c.fetchall()
-    conn.close()
     
     rates = get_metal_rates()
     
@@ -273,7 +453,6 @@ def admin_products():
     c = conn.cursor()
     c.execute('SELECT * FROM products ORDER BY id DESC')
     products = c.fetchall()
-    conn.close()
     
     return render_template('admin/products.html', products=products)
 
@@ -302,6 +481,7 @@ def admin_add_product():
             if file and file.filename:
                 filename = secure_filename(file.filename)
                 file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+                image_pipeline.submit(f'images/products/{filename}')
                 image = filename
         
         purity = request.form['purity']
@@ -320,7 +500,6 @@ def admin_add_product():
         except sqlite3.IntegrityError:
             flash('SKU already exists!', 'error')
         
-        conn.close()
         return redirect(url_for('admin_products'))
     
     return render_template('admin/add_product.html')
@@ -348,7 +527,7 @@ def admin_edit_product(product_id):
         is_hidden = 1 if request.form.get('is_hidden') else 0
         
         c.execute('SELECT image FROM products WHERE id = ?', (product_id,))
-        current_image = c.fetchone()[0]
+        current_image = c.fetchone()['image']
         image = current_image
         
         if 'image' in request.files:
@@ -356,6 +535,7 @@ def admin_edit_product(product_id):
             if file and file.filename:
                 filename = secure_filename(file.filename)
                 file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+                image_pipeline.submit(f'images/products/{filename}')
                 image = filename
         
         purity = request.form['purity']
@@ -367,14 +547,12 @@ def admin_edit_product(product_id):
                     WHERE id=?''',
                  (name, sku, category, description, price_type, weight_in_grams, base_price, metal_type, purity, image, image_url, weight, making_charges, making_charges_type, is_hidden, product_id))
         conn.commit()
-        conn.close()
         
         flash('Product updated successfully!', 'success')
         return redirect(url_for('admin_products'))
     
     c.execute('SELECT * FROM products WHERE id = ?', (product_id,))
     product = c.fetchone()
-    conn.close()
     
     if not product:
         flash('Product not found!', 'error')
@@ -391,7 +569,6 @@ def admin_delete_product(product_id):
     c = conn.cursor()
     c.execute('DELETE FROM products WHERE id = ?', (product_id,))
     conn.commit()
-    conn.close()
     
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('admin_products'))
@@ -420,8 +597,9 @@ def admin_update_rates():
     c.execute('UPDATE metal_rates SET rate_per_gram = ? WHERE metal = ?', 
               (silver_rate, 'silver'))
     
+    # Reprice every per-gram product in the same transaction as the new rates
+    refresh_prices(conn, "price_type = 'per_gram'")
     conn.commit()
-    conn.close()
     
     flash('Metal rates updated successfully!', 'success')
     return redirect(url_for('admin_rates'))
@@ -435,9 +613,8 @@ def admin_settings():
     c = conn.cursor()
     c.execute('SELECT * FROM settings')
     settings = c.fetchall()
-    conn.close()
     
-    settings_dict = {setting[1]: setting[2] for setting in settings}
+    settings_dict = {setting['setting_key']: setting['setting_value'] for setting in settings}
     
     return render_template('admin/settings.html', settings=settings_dict)
 
@@ -455,11 +632,11 @@ def admin_update_settings():
               (whatsapp_number, 'whatsapp_number'))
     
     conn.commit()
-    conn.close()
     
     flash('Settings updated successfully!', 'success')
     return redirect(url_for('admin_settings'))
 
 if __name__ == '__main__':
-    init_db()
+    with app.app_context():
+        init_db()
     app.run(debug=True,port=5001)
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Fingerprinted static assets for Samrat Jewellers
+
+Every file under static/ gets a URL with its content hash in the name
+(css/style.3f2a9c1b7d4e.css) so browsers can cache it for a year without
+revalidating; a new deploy changes the hash instead of relying on users to
+hard-refresh. Text assets are also precompressed to gzip and brotli under
+static/dist and picked per request from Accept-Encoding.
+
+    python assets.py build              # hash and precompress ahead of the first request
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+
+from flask import abort, send_file
+
+from images import run_native
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.html')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+PRECACHE_MAX_BYTES = 256 * 1024  # larger files are cached on first use instead
+
+ASSET_CHECK_INTERVAL = 5  # seconds between rescans for changed or uploaded files
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class StaticAssets:
+    """Maps static filenames to content-hashed URLs and serves them back"""
+
+    def __init__(self, static_folder='static', output='dist', prehashed=('images/derived/',),
+                 excluded=('images/products/',)):
+        self.static_folder = static_folder
+        self.output = output
+        # Derived images already carry a content hash in their names (images.py)
+        self.prehashed = tuple(prehashed)
+        # Admin uploads are served from /static/ as they are: hashing them
+        # would rescan a growing folder and move the version on every upload
+        self.excluded = tuple(excluded)
+        self.encodings = available_encodings()
+        self._entries = {}   # filename -> entry
+        self._hashed = {}    # hashed filename -> entry
+        self._version = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self.refresh()
+
+    @property
+    def version(self):
+        """Digest of every asset hash, for cache keys and the service worker"""
+        self._maybe_refresh()
+        return self._version
+
+    def url_path(self, filename):
+        """Hashed path for filename relative to static_folder, or None if unknown"""
+        self._maybe_refresh()
+        entry = self._entries.get(filename.lstrip('/'))
+        return entry['hashed'] if entry else None
+
+    def precache(self, include, exclude=(), max_bytes=PRECACHE_MAX_BYTES):
+        """Hashed paths of assets under the include prefixes, for the service worker"""
+        self._maybe_refresh()
+        return sorted(entry['hashed'] for filename, entry in self._entries.items()
+                      if filename.startswith(tuple(include)) and not filename.startswith(tuple(exclude))
+                      and entry['size'] <= max_bytes)
+
+    def send(self, hashed, accept_encodings):
+        """Response for a hashed path, precompressed when the client accepts it"""
+        self._maybe_refresh()
+        entry = self._hashed.get(hashed)
+        if entry is None:
+            abort(404)
+
+        path, encoding = entry['source'], None
+        for candidate in entry['encodings']:
+            if accept_encodings[candidate]:
+                path, encoding = self._compressed_path(entry, candidate), candidate
+                break
+
+        response = send_file(os.path.abspath(path), mimetype=entry['mimetype'], max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def refresh(self):
+        """Rehash files that changed since the last scan; returns the entry count"""
+        # Hashing and compressing run off the request greenlet under gevent
+        entries = run_native(self._scan, self._entries)
+        digest = hashlib.sha256()
+        for filename in sorted(entries):
+            if entries[filename]['hash']:
+                digest.update(f"{filename}:{entries[filename]['hash']}\n".encode())
+        with self._lock:
+            self._entries = entries
+            self._hashed = {entry['hashed']: entry for entry in entries.values()}
+            self._version = digest.hexdigest()[:12]
+        return len(entries)
+
+    def _scan(self, previous):
+        """{filename: entry} of every asset, reusing previous entries of unchanged files"""
+        root = os.path.abspath(self.static_folder)
+        skipped = {os.path.join(root, self.output)}
+        skipped.update(os.path.join(root, *prefix.strip('/').split('/')) for prefix in self.excluded)
+        entries = {}
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames
+                                 if not d.startswith('.') and os.path.join(directory, d) not in skipped)
+            for name in sorted(filenames):
+                if name.startswith('.') or name.endswith('.tmp'):
+                    continue
+                source = os.path.join(directory, name)
+                filename = os.path.relpath(source, root).replace(os.sep, '/')
+                if filename.startswith(self.excluded):
+                    continue
+                try:
+                    stat = os.stat(source)
+                except OSError:
+                    continue
+                entry = previous.get(filename)
+                if filename.startswith(self.prehashed):
+                    if filename.endswith(('.avif', '.webp')):
+                        entry = entry or self._prehashed(filename, source, stat)
+                    else:
+                        continue
+                elif not entry or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+                    entry = self._build(filename, source, stat)
+                entries[filename] = entry
+        return entries
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < ASSET_CHECK_INTERVAL:
+            return
+        # One rescan at a time; other requests keep using the current mapping
+        if not self._refreshing.acquire(blocking=False):
+            return
+        try:
+            if now - self._checked_at >= ASSET_CHECK_INTERVAL:
+                self._checked_at = now
+                self.refresh()
+        finally:
+            self._refreshing.release()
+
+    def _build(self, filename, source, stat):
+        with open(source, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, extension = os.path.splitext(filename)
+        entry = {
+            'source': source,
+            'hashed': f'{stem}.{digest}{extension}',
+            'hash': digest,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'mimetype': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            'encodings': (),
+        }
+        if extension.lower() in COMPRESSIBLE_EXTENSIONS and data:
+            entry['encodings'] = tuple(encoding for encoding in self.encodings
+                                       if self._write_compressed(entry, encoding, data))
+        return entry
+
+    def _prehashed(self, filename, source, stat):
+        return {'source': source, 'hashed': filename, 'hash': None, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                'mimetype': mimetypes.guess_type(filename)[0] or 'application/octet-stream', 'encodings': ()}
+
+    def _compressed_path(self, entry, encoding):
+        suffix = 'br' if encoding == 'br' else 'gz'
+        return os.path.join(self.static_folder, self.output, f"{entry['hashed']}.{suffix}")
+
+    def _write_compressed(self, entry, encoding, data):
+        target = self._compressed_path(entry, encoding)
+        if os.path.exists(target):
+            return True
+        compressed = compress(data, encoding)
+        if len(compressed) >= len(data):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = f'{target}.{os.getpid()}.tmp'
+        with open(partial, 'wb') as f:
+            f.write(compressed)
+        os.replace(partial, target)
+        return True
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress static assets')
+    parser.add_argument('command', choices=('build',))
+    parser.add_argument('--static', default='static', help='static folder')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    assets = StaticAssets(args.static)
+    compressed = sum(1 for entry in assets._entries.values() if entry['encodings'])
+    print(f"Encodings: {', '.join(assets.encodings)}")
+    print(f"✓ Fingerprinted {len(assets._entries)} assets ({compressed} precompressed), "
+          f"version {assets.version}, in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for Samrat Jewellers
+
+Seeds the in-memory storage backend with a synthetic catalog (plus matching
+customers and wishlists), drives the public and admin pages with concurrent
+clients and reports p50/p95/p99 latency, throughput and backend calls per
+request for every catalog size. Results are written as JSON; pass a previous
+results file with --baseline to flag regressions.
+
+    python benchmark.py --sizes 1k,10k --requests 300 --clients 8
+    python benchmark.py --sizes 100k --mode wsgi --latency-ms 40 --out bench.json
+    python benchmark.py --baseline bench.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# The app must come up on the memory backend, so pick it before importing app
+os.environ['STORAGE_BACKEND'] = 'memory'
+
+CATEGORIES = ['Necklaces', 'Rings', 'Earrings', 'Bracelets', 'Pendants', 'Chains']
+METALS = {'gold': ['18K', '22K', '24K'], 'silver': ['925', '999']}
+ADJECTIVES = ['Classic', 'Royal', 'Antique', 'Floral', 'Temple', 'Modern', 'Twisted', 'Bridal', 'Kundan', 'Polki']
+ITEMS = ['Necklace', 'Ring', 'Jhumka', 'Bangle', 'Pendant', 'Chain', 'Stud', 'Kada', 'Mangalsutra', 'Anklet']
+SEARCH_TERMS = ['royal', 'gold', 'ring', 'temple neck', 'bri', 'silver chain', 'kundan', 'anti']
+
+ADMIN_ID = 'admin'
+# Anything else counts as an error
+OK_STATUSES = (200, 304)
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def product_id(index):
+    return f'SJ{index:07d}'
+
+
+def synthetic_tree(size, seed=42):
+    """Products, categories, rates, settings, customers and wishlists"""
+    rng = random.Random(seed)
+    products = {}
+    for index in range(size):
+        category = CATEGORIES[index % len(CATEGORIES)]
+        metal = rng.choice(list(METALS))
+        per_gram = rng.random() < 0.7
+        weight = round(rng.uniform(1, 60), 2)
+        products[product_id(index)] = {
+            'name': f'{rng.choice(ADJECTIVES)} {metal.title()} {rng.choice(ITEMS)} {index}',
+            'sku': product_id(index),
+            'category': category,
+            'description': f'{rng.choice(ADJECTIVES)} handcrafted {category.lower()[:-1]} in {metal}',
+            'price_type': 'per_gram' if per_gram else 'fixed',
+            'weight': weight,
+            'weight_in_grams': weight,
+            'base_price': 0.0 if per_gram else round(rng.uniform(500, 250000), 2),
+            'metal_type': metal,
+            'purity': rng.choice(METALS[metal]),
+            'making_charges': round(rng.uniform(5, 20), 2) if per_gram else round(rng.uniform(100, 5000), 2),
+            'making_charges_type': 'percent' if per_gram else 'rupees',
+            'image_url': '',
+            'image': 'default.jpg',
+            'is_hidden': rng.random() < 0.05
+        }
+
+    customer_count = max(100, size // 10)
+    customers = {}
+    wishlists = {}
+    for index in range(customer_count):
+        mobile = f'9{index:09d}'
+        customers[mobile] = {'name': f'Customer {index}', 'mobile': mobile,
+                             'registered_date': '2024-01-01', 'registered_at': '2024-01-01T00:00:00'}
+        items = rng.sample(range(size), min(size, rng.randint(0, 20)))
+        if items:
+            wishlists[mobile] = {product_id(i): {'added_at': '2024-01-01T00:00:00'} for i in items}
+
+    now = datetime.now().isoformat()
+    return {
+        'products': products,
+        'categories': {name.lower(): {'name': name, 'is_hidden': False, 'image_url': ''} for name in CATEGORIES},
+        'metal_rates': {
+            'gold': {'rate_per_gram': 6500.0, 'source': 'Manual', 'fetched_at': now},
+            'silver': {'rate_per_gram': 85.0, 'source': 'Manual', 'fetched_at': now}
+        },
+        'settings': {'whatsapp_number': '919034772610'},
+        'users': {ADMIN_ID: {'name': 'Benchmark Admin', 'email': 'bench@example.com',
+                             'password_hash': '', 'role': 'admin'}},
+        'customers': customers,
+        'wishlists': wishlists,
+        'meta': {'customers_keyed_by_mobile': True, 'user_emails_indexed': True}
+    }
+
+
+def scenarios(appmod, size, rng):
+    """Scenario name -> (path generator, session) for one seeded catalog"""
+    customers = max(100, size // 10)
+    first_page = appmod.paginator.page(limit=appmod.SHOP_PAGE_SIZE)
+    shop_cursor = first_page.next_cursor or ''
+    admin_page = appmod.paginator.page(limit=appmod.ADMIN_PAGE_SIZE, include_hidden=True)
+    admin_cursor = admin_page.next_cursor or ''
+    visible_ids = [key for key, product in appmod.catalog.products().items() if not product.get('is_hidden')]
+
+    def shop_filters():
+        category = rng.choice(CATEGORIES)
+        metal = rng.choice(list(METALS))
+        return f'/shop?category={category}&metal={metal}'
+
+    return {
+        'home': (lambda: '/', None),
+        'shop': (lambda: '/shop', None),
+        'shop_search': (lambda: '/shop?search=' + urllib.request.quote(rng.choice(SEARCH_TERMS)), None),
+        'shop_filters': (shop_filters, None),
+        'shop_sort_price': (lambda: '/shop?sort=' + rng.choice(['price-low', 'price-high']), None),
+        'shop_sort_name': (lambda: '/shop?sort=name', None),
+        'shop_price_range': (lambda: '/shop?price=' + rng.choice(['0-10000', '10000-50000', '50000-500000']), None),
+        'shop_next_page': (lambda: f'/shop?cursor={shop_cursor}', None),
+        'shop_more': (lambda: f'/shop/more?cursor={shop_cursor}', None),
+        'product_detail': (lambda: f'/product/{product_id(rng.randrange(size))}', None),
+        'api_products': (lambda: '/api/products?fields=id,price&limit=100', None),
+        'api_product': (lambda: f'/api/products/{rng.choice(visible_ids)}', None),
+        'wishlist': (lambda: '/wishlist', lambda: {'user_mobile': f'9{rng.randrange(customers):09d}'}),
+        'admin_products': (lambda: '/admin/products', {'user_id': ADMIN_ID}),
+        'admin_products_next': (lambda: f'/admin/products?cursor={admin_cursor}', {'user_id': ADMIN_ID}),
+        'admin_users': (lambda: '/admin/users', {'user_id': ADMIN_ID})
+    }
+
+
+class TestClientDriver:
+    """Requests through Flask's test client, one client per worker thread"""
+
+    def __init__(self, app):
+        self._app = app
+        self._local = threading.local()
+
+    def get(self, path, cookie):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._app.test_client(use_cookies=False)
+        response = client.get(path, headers={'Cookie': cookie} if cookie else {})
+        response.get_data()
+        return response.status_code, response.headers.get('X-Backend-Calls')
+
+    def close(self):
+        pass
+
+
+class WSGIDriver:
+    """Requests over HTTP to a threaded local WSGI server"""
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self._base = f'http://127.0.0.1:{self._server.server_port}'
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def get(self, path, cookie):
+        request = urllib.request.Request(self._base + path, headers={'Cookie': cookie} if cookie else {})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers.get('X-Backend-Calls')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('X-Backend-Calls')
+
+    def close(self):
+        self._server.shutdown()
+
+
+def session_cookie(app, values):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps(values)}"
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3) if len(values) else None
+
+
+def run_scenario(driver, app, make_path, session, requests, clients, warmup):
+    """Fire requests from concurrent clients; returns the scenario metrics"""
+    def cookie():
+        values = session() if callable(session) else session
+        return session_cookie(app, values) if values else None
+
+    for _ in range(warmup):
+        driver.get(make_path(), cookie())
+
+    # Paths are drawn up front so the random generator isn't shared across threads
+    jobs = [(make_path(), cookie()) for _ in range(requests)]
+    latencies = []
+    backend_calls = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(job):
+        nonlocal errors
+        path, job_cookie = job
+        started = time.perf_counter()
+        try:
+            status, calls = driver.get(path, job_cookie)
+        except Exception as e:
+            print(f"Request {path} failed: {e!r}")
+            status, calls = None, None
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if status not in OK_STATUSES:
+                errors += 1
+            if calls is not None:
+                backend_calls.append(int(calls))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, jobs))
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': round(float(np.mean(latencies)), 3) if latencies else None,
+        'throughput_rps': round(requests / wall, 2) if wall else None,
+        'backend_calls_per_request': round(float(np.mean(backend_calls)), 3) if backend_calls else None
+    }
+
+
+def seed(appmod, tree):
+    """Replace the whole data tree; the catalog listener reloads every index"""
+    appmod.storage_backend.reference('/').set(tree)
+    for name in appmod.CONFIG_NODES:
+        appmod.config_cache.refresh(name)
+    appmod.page_cache.clear()
+    appmod.catalog.products()
+
+
+def compare(results, baseline, threshold):
+    """Scenarios whose p95 or backend calls grew by more than threshold"""
+    regressions = []
+    for size, size_results in results.items():
+        for scenario, metrics in size_results.items():
+            before = baseline.get(size, {}).get(scenario)
+            if not before:
+                continue
+            for metric in ('p95_ms', 'p99_ms', 'backend_calls_per_request'):
+                old, new = before.get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                # Sub-millisecond noise isn't a regression
+                floor = 1.0 if metric.endswith('_ms') else 0.0
+                if new > old * (1 + threshold) and new - old > floor:
+                    regressions.append({'size': size, 'scenario': scenario, 'metric': metric,
+                                        'baseline': old, 'current': new,
+                                        'change': round(new / old - 1, 3) if old else None})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Samrat Jewellers load and latency benchmark')
+    parser.add_argument('--sizes', default='1k,10k,100k,1m', help='catalog sizes, e.g. 1k,10k,100k,1m')
+    parser.add_argument('--scenarios', default='', help='comma-separated subset of scenarios')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per scenario')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--mode', choices=('client', 'wsgi'), default='client',
+                        help='Flask test client or a local threaded WSGI server')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='injected backend latency per call')
+    parser.add_argument('--ms-per-kb', type=float, default=0.0, help='injected backend cost per KB')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench_output.json', help='results file')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative growth before flagging')
+    args = parser.parse_args()
+
+    import app as appmod
+
+    appmod.storage_backend.latency = args.latency_ms / 1000
+    appmod.storage_backend.seconds_per_kb = args.ms_per_kb / 1000
+    app = appmod.app
+    rng = random.Random(args.seed)
+    wanted = [name for name in args.scenarios.split(',') if name]
+
+    results = {}
+    for size in [parse_size(text) for text in args.sizes.split(',') if text]:
+        print(f"Seeding {size} products...")
+        started = time.perf_counter()
+        seed(appmod, synthetic_tree(size, args.seed))
+        print(f"✓ Seeded in {time.perf_counter() - started:.1f}s")
+
+        driver = WSGIDriver(app) if args.mode == 'wsgi' else TestClientDriver(app)
+        size_results = {}
+        try:
+            for name, (make_path, session) in scenarios(appmod, size, rng).items():
+                if wanted and name not in wanted:
+                    continue
+                metrics = run_scenario(driver, app, make_path, session, args.requests, args.clients, args.warmup)
+                size_results[name] = metrics
+                print(f"  {name:22} p50 {metrics['p50_ms']:>9.2f}ms  p95 {metrics['p95_ms']:>9.2f}ms  "
+                      f"p99 {metrics['p99_ms']:>9.2f}ms  {metrics['throughput_rps']:>8.1f} req/s  "
+                      f"calls {metrics['backend_calls_per_request']}  errors {metrics['errors']}")
+        finally:
+            driver.close()
+        results[str(size)] = size_results
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mode': args.mode,
+            'clients': args.clients,
+            'requests': args.requests,
+            'latency_ms': args.latency_ms,
+            'ms_per_kb': args.ms_per_kb,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('results', {})
+        report['regressions'] = compare(results, baseline, args.threshold)
+        for regression in report['regressions']:
+            print(f"✗ Regression {regression['size']}/{regression['scenario']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']}")
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+In-process catalog snapshot for Samrat Jewellers
+
+Loads the products node once and keeps it current through a streaming
+listen() subscription, so read routes never download the whole catalog.
+"""
+
+import contextvars
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def product_hash(product_id, product):
+    """64-bit hash of one product, keys sorted so field order doesn't matter"""
+    encoded = json.dumps([product_id, product], sort_keys=True, default=str).encode()
+    return int.from_bytes(hashlib.sha1(encoded).digest()[:8], 'big')
+
+
+class CatalogSnapshot:
+    """Copy of the products node served from memory with a version counter"""
+
+    def __init__(self, reference_factory, load_timeout=10, fetch_workers=8):
+        # reference_factory returns a storage reference to the products node
+        # (see storage.py), anything exposing get()/child()/listen()
+        self._reference_factory = reference_factory
+        self._load_timeout = load_timeout
+        self._fetch_workers = fetch_workers
+        self._products = {}
+        self._shared = False  # True once the current mapping was handed to a reader
+        self._lock = threading.RLock()
+        self._loaded = threading.Event()
+        self._started = False
+        self._registration = None
+        self._subscribers = []
+        self._hashes = {}     # product id -> hash of the id and its content
+        self._checksum = 0    # XOR of _hashes, so one change costs one hash
+        self.version = 0
+
+    def start(self):
+        """Subscribe to the products node, falling back to a single get()"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        ref = self._reference_factory()
+        try:
+            self._registration = ref.listen(self.handle_event)
+        except Exception as e:
+            print(f"Catalog listener unavailable, loading once: {e}")
+            self._replace(ref.get() or {})
+            return
+
+        # The first listener event carries the full tree; don't wait forever for it
+        if not self._loaded.wait(self._load_timeout):
+            self._replace(ref.get() or {})
+
+    def stop(self):
+        if self._registration:
+            self._registration.close()
+            self._registration = None
+        with self._lock:
+            self._started = False
+            self._loaded.clear()
+
+    def subscribe(self, callback):
+        """Call callback(product_id, product) on every change
+
+        product_id is None when the whole catalog was (re)loaded, in which case
+        product is the full mapping. A deleted product is reported as None.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            if self._loaded.is_set():
+                self._shared = True
+                callback(None, self._products)
+
+    def products(self):
+        """Return the current {product_id: product} mapping (do not mutate)
+
+        The mapping stays as it is while the caller holds it; later changes go
+        to a copy.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            self._shared = True
+            return self._products
+
+    @property
+    def digest(self):
+        """Hash of the catalog's content
+
+        Unlike version, which counts changes in this process, it is the same
+        in every instance and after a restart for the same products.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return f'{self._checksum:016x}'
+
+    def get(self, product_id):
+        self._ensure_loaded()
+        return self._products.get(product_id)
+
+    def get_many(self, product_ids):
+        """Resolve several products in one step
+
+        Returns ({product_id: product}, backend_calls). Products come from the
+        snapshot; ids it doesn't know are only fetched (concurrently, on a
+        bounded pool) when no listener keeps the snapshot live.
+        """
+        products = self.products()
+        found = {pid: products[pid] for pid in product_ids if pid in products}
+        missing = [pid for pid in product_ids if pid not in found]
+        if not missing or self._registration is not None:
+            return found, 0
+
+        ref = self._reference_factory()
+        with ThreadPoolExecutor(max_workers=min(self._fetch_workers, len(missing))) as pool:
+            contexts = [contextvars.copy_context() for _ in missing]
+            fetched = pool.map(lambda pid, context: context.run(ref.child(pid).get), missing, contexts)
+            for product_id, product in zip(missing, fetched):
+                if product:
+                    found[product_id] = product
+        return found, len(missing)
+
+    def __contains__(self, product_id):
+        self._ensure_loaded()
+        return product_id in self._products
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._products)
+
+    # Local write-through, called by admin routes right after the Firebase write
+
+    def put(self, product_id, data):
+        self._apply(product_id, [([], data)])
+
+    def update(self, product_id, data):
+        self._apply(product_id, [([field], value) for field, value in data.items()])
+
+    def delete(self, product_id):
+        self._apply(product_id, [([], None)])
+
+    def handle_event(self, event):
+        """Apply a firebase_admin.db.Event (event_type, path, data)"""
+        parts = [p for p in (event.path or '/').split('/') if p]
+
+        if event.event_type == 'patch':
+            changes = {}
+            for key, value in (event.data or {}).items():
+                path = parts + [p for p in key.split('/') if p]
+                changes.setdefault(path[0], []).append((path[1:], value))
+            for product_id, product_changes in changes.items():
+                self._apply(product_id, product_changes)
+        elif not parts:
+            self._replace(event.data or {})
+        else:
+            self._apply(parts[0], [(parts[1:], event.data)])
+
+    def _ensure_loaded(self):
+        if not self._loaded.is_set():
+            self.start()
+            self._loaded.wait(self._load_timeout)
+
+    def _replace(self, products):
+        with self._lock:
+            self._products = dict(products)
+            self._shared = True
+            self._hashes = {pid: product_hash(pid, product) for pid, product in self._products.items()}
+            self._checksum = 0
+            for value in self._hashes.values():
+                self._checksum ^= value
+            self.version += 1
+            self._notify(None, self._products)
+        self._loaded.set()
+
+    def _apply(self, product_id, changes):
+        # Copy-on-write, but only when a reader may still hold the mapping, so
+        # a run of writes with no reads in between (a backfill) stays O(1) each
+        with self._lock:
+            if self._shared:
+                self._products = dict(self._products)
+                self._shared = False
+            products = self._products
+            product = products.get(product_id)
+
+            for path, value in changes:
+                if not path:
+                    product = value
+                    continue
+                product = dict(product or {})
+                node = product
+                for key in path[:-1]:
+                    node[key] = dict(node.get(key) or {})
+                    node = node[key]
+                if value is None:
+                    node.pop(path[-1], None)
+                else:
+                    node[path[-1]] = value
+
+            self._checksum ^= self._hashes.pop(product_id, 0)
+            if product:
+                products[product_id] = product
+                self._hashes[product_id] = product_hash(product_id, product)
+                self._checksum ^= self._hashes[product_id]
+            else:
+                products.pop(product_id, None)
+
+            self.version += 1
+            self._notify(product_id, products.get(product_id))
+
+    def _notify(self, product_id, product):
+        for callback in self._subscribers:
+            try:
+                callback(product_id, product)
+            except Exception as e:
+                print(f"Catalog subscriber failed: {e}")
@@ -0,0 +1,148 @@
+"""
+Catalog API serialization for Samrat Jewellers
+
+/api/products answers with compact JSON or MessagePack. Each product record
+is serialized once per field set and format and kept as bytes, so a list
+response is the cached records spliced into an envelope instead of
+re-encoding every product on every request. Records are dropped when their
+product changes (as a catalog subscriber) or when prices or asset URLs move.
+"""
+
+import json
+import threading
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+API_FIELDS = ('id', 'name', 'sku', 'category', 'description', 'metal_type', 'purity',
+              'price_type', 'weight', 'making_charges', 'making_charges_type',
+              'price', 'image_url', 'url')
+DEFAULT_FIELDS = ('id', 'name', 'sku', 'category', 'metal_type', 'purity', 'weight', 'price', 'image_url', 'url')
+
+MIME_JSON = 'application/json'
+MIME_MSGPACK = 'application/msgpack'
+MSGPACK_MIMETYPES = (MIME_MSGPACK, 'application/x-msgpack')
+
+
+def parse_fields(value):
+    """Field tuple for a fields= argument; raises ValueError on unknown names"""
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or DEFAULT_FIELDS
+
+
+def negotiate(accept_mimetypes):
+    """'msgpack' when the client prefers it and it is installed, else 'json'"""
+    if msgpack is None:
+        return 'json'
+    best = accept_mimetypes.best_match((MIME_JSON,) + MSGPACK_MIMETYPES, default=MIME_JSON)
+    return 'msgpack' if best in MSGPACK_MIMETYPES else 'json'
+
+
+def mimetype(fmt):
+    return MIME_MSGPACK if fmt == 'msgpack' else MIME_JSON
+
+
+def encode(value, fmt):
+    if fmt == 'msgpack':
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def list_body(records, meta, fmt):
+    """{"products": [records...], **meta} with records already serialized"""
+    if fmt == 'msgpack':
+        packer = msgpack.Packer(use_bin_type=True)
+        parts = [packer.pack_map_header(1 + len(meta)), packer.pack('products'),
+                 packer.pack_array_header(len(records))]
+        parts.extend(records)
+        for key, value in meta.items():
+            parts.append(packer.pack(key))
+            parts.append(packer.pack(value))
+        return b''.join(parts)
+    body = b'{"products":[' + b','.join(records) + b']'
+    if meta:
+        body += b',' + encode(meta, fmt)[1:]
+    else:
+        body += b'}'
+    return body
+
+
+class PayloadCache:
+    """Serialized product records keyed by product, field set and format
+
+    describe(product_id, product) returns every API field of one product;
+    version() covers what records depend on beyond the product itself
+    (prices, asset URLs) and clears the cache when it changes.
+    """
+
+    def __init__(self, describe, version, max_entries=50000):
+        self.describe = describe
+        self.version = version
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._records = {}  # product_id -> {(fields, fmt): bytes}
+        self._size = 0
+        self._version = None
+        self._generation = 0  # bumped on every change, so records built from stale data aren't kept
+        self.hits = 0
+        self.misses = 0
+
+    def apply(self, product_id, product):
+        """CatalogSnapshot subscriber: drop records of changed products"""
+        with self._lock:
+            self._generation += 1
+            if product_id is None:
+                self._records = {}
+                self._size = 0
+            else:
+                self._size -= len(self._records.pop(product_id, ()))
+
+    def record(self, product_id, product, fields, fmt):
+        return self.records([(product_id, product)], fields, fmt)[0]
+
+    def records(self, items, fields, fmt):
+        """Serialized records for [(product_id, product)], building only the misses"""
+        version = self.version()
+        key = (fields, fmt)
+        results = [None] * len(items)
+        with self._lock:
+            if version != self._version:
+                self._records = {}
+                self._size = 0
+                self._version = version
+            for i, (product_id, _) in enumerate(items):
+                results[i] = self._records.get(product_id, {}).get(key)
+            missing = [i for i, data in enumerate(results) if data is None]
+            self.hits += len(items) - len(missing)
+            self.misses += len(missing)
+            generation = self._generation
+        if not missing:
+            return results
+
+        for i in missing:
+            full = self.describe(*items[i])
+            results[i] = encode({field: full.get(field) for field in fields}, fmt)
+        with self._lock:
+            if self._version == version and self._generation == generation:
+                if self._size + len(missing) > self.max_entries:
+                    self._records = {}
+                    self._size = 0
+                for i in missing:
+                    records = self._records.setdefault(items[i][0], {})
+                    if key not in records:
+                        self._size += 1
+                    records[key] = results[i]
+        return results
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'records': self._size, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
@@ -0,0 +1,112 @@
+"""
+Config cache for Samrat Jewellers
+
+Settings, categories and metal rates are small and rarely change, so they are
+kept in memory. Admin routes write through to the cache right after the
+Firebase write, and every node is re-read after a bounded TTL so changes made
+outside the app are still picked up.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+
+CONFIG_NODES = ('settings', 'categories', 'metal_rates')
+
+
+def value_digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+class ConfigCache:
+    """Per-node cached values with versions and write-through helpers"""
+
+    def __init__(self, loader, ttl=60, nodes=CONFIG_NODES):
+        # loader(name) returns the current value of the node from the backend
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values = {}
+        self._expires = {}
+        self._versions = {name: 0 for name in nodes}
+        self._digests = {}
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Call callback(name, value) whenever a node's value changes"""
+        self._subscribers.append(callback)
+
+    def get(self, name):
+        """Copy of the node's value, so callers can't change the cached one"""
+        if self._expires.get(name, 0) <= time.monotonic():
+            self.refresh(name)
+        return copy.deepcopy(self._values.get(name) or {})
+
+    def version(self, name):
+        """Version of the node's current value, re-reading it if expired"""
+        if self._expires.get(name, 0) <= time.monotonic():
+            self.refresh(name)
+        return self._versions[name]
+
+    def digest(self, name):
+        """Hash of the node's current value, the same in every process holding it"""
+        if self._expires.get(name, 0) <= time.monotonic():
+            self.refresh(name)
+        return self._digests.get(name)
+
+    def refresh(self, name):
+        value = self._loader(name) or {}
+        self._store(name, value)
+        return value
+
+    def refresh_many(self, names, fetch):
+        """Re-read every expired node in names with one fetch(calls) step
+
+        fetch receives {name: loader} and returns {name: value}, e.g.
+        fanout.fetch_parallel. Nodes it fails to return keep their old value
+        and stay expired, so the next request tries again.
+        """
+        now = time.monotonic()
+        expired = [name for name in names if self._expires.get(name, 0) <= now]
+        if expired:
+            values = fetch({name: (lambda name=name: self._loader(name)) for name in expired})
+            for name, value in values.items():
+                self._store(name, value or {})
+        return {name: copy.deepcopy(self._values.get(name) or {}) for name in names}
+
+    # Write-through, called by admin routes right after the Firebase write
+
+    def set(self, name, value):
+        self._store(name, value or {})
+
+    def update(self, name, changes):
+        self._store(name, dict(self.get(name), **changes))
+
+    def set_child(self, name, key, value):
+        value_map = dict(self.get(name))
+        if value is None:
+            value_map.pop(key, None)
+        else:
+            value_map[key] = value
+        self._store(name, value_map)
+
+    def update_child(self, name, key, changes):
+        child = dict(self.get(name).get(key) or {}, **changes)
+        self.set_child(name, key, child)
+
+    def _store(self, name, value):
+        # Keep a private copy, the caller may go on using its own
+        value = copy.deepcopy(value)
+        with self._lock:
+            changed = self._values.get(name) != value
+            self._values[name] = value
+            self._expires[name] = time.monotonic() + self.ttl
+            if changed or name not in self._digests:
+                self._digests[name] = value_digest(value)
+            if changed:
+                self._versions[name] += 1
+        if changed:
+            for callback in self._subscribers:
+                callback(name, value)
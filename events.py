@@ -0,0 +1,141 @@
+"""
+Server-Sent Events for Samrat Jewellers
+
+Open pages keep one /events/rates connection and receive the new metal rates
+(and the recomputed prices of the products they show) as soon as the rates
+change, instead of staying stale until a reload.
+
+Only the latest event matters to a shop page, so the hub keeps just that
+one and wakes every waiting stream when it changes: publishing costs the
+same with ten clients as with ten thousand, and a slow client can't make
+others wait. Served by gevent (see app.py), each idle connection is a
+greenlet blocked on the hub's condition rather than an OS thread.
+
+    SSE_MAX_CLIENTS=5000     # streams beyond this get 503 and retry later
+"""
+
+import json
+import os
+import threading
+import time
+
+SSE_MIMETYPE = 'text/event-stream'
+HEARTBEAT_SECONDS = 15       # comment lines keep proxies from closing idle streams
+STREAM_MAX_SECONDS = 1800    # streams end now and then so clients spread across restarts
+RETRY_MS = 5000
+
+
+def format_event(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class BroadcastHub:
+    """The latest event of one stream, and the clients waiting for the next"""
+
+    def __init__(self, event='message', max_clients=5000, heartbeat=HEARTBEAT_SECONDS, max_age=STREAM_MAX_SECONDS):
+        self.event = event
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._latest = None  # (event_id, data)
+        self.clients = 0
+        self.published = 0
+        self.rejected = 0
+
+    def publish(self, event_id, data):
+        """Replace the latest event and wake every stream"""
+        with self._condition:
+            self._generation += 1
+            self._latest = (event_id, data)
+            self.published += 1
+            self._condition.notify_all()
+
+    def latest(self):
+        with self._condition:
+            return self._latest
+
+    def connect(self, last_event_id=None, render=None):
+        """SSE body for one new client, or None (counted) when the hub is full
+
+        Checking the capacity and counting the client are one step, so
+        concurrent connects can't go past max_clients. The client stays
+        counted until the body is closed.
+        """
+        with self._condition:
+            if self.clients >= self.max_clients:
+                self.rejected += 1
+                return None
+            self.clients += 1
+        return ClientStream(self, self._events(last_event_id, render))
+
+    def _events(self, last_event_id, render):
+        """SSE text for one client
+
+        The latest event is sent straight away unless the client already has
+        it (Last-Event-ID), which also covers pages served from a cache.
+        render(data) turns the shared event into this client's payload.
+        """
+        render = render or (lambda data: data)
+        yield f'retry: {RETRY_MS}\n\n'
+        deadline = time.monotonic() + self.max_age
+        with self._condition:
+            generation, latest = self._generation, self._latest
+        sent = last_event_id
+        while True:
+            if latest and latest[0] != sent:
+                sent = latest[0]
+                yield format_event(sent, self.event, render(latest[1]))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            with self._condition:
+                if self._generation == generation:
+                    self._condition.wait(min(self.heartbeat, remaining))
+                changed = self._generation != generation
+                generation, latest = self._generation, self._latest
+            if not changed:
+                yield ': ping\n\n'
+
+    def _release(self):
+        with self._condition:
+            self.clients -= 1
+
+    def stats(self):
+        with self._condition:
+            return {'clients': self.clients, 'max_clients': self.max_clients,
+                    'published': self.published, 'rejected': self.rejected}
+
+
+class ClientStream:
+    """Response body of one stream, holding its client slot until closed
+
+    A generator's finally never runs if it is closed before its first read,
+    so the slot is given back by close(), which the WSGI server always calls.
+    """
+
+    def __init__(self, hub, events):
+        self._hub = hub
+        self._events = events
+        self._lock = threading.Lock()
+        self._open = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        self._events.close()
+        with self._lock:
+            if not self._open:
+                return
+            self._open = False
+        self._hub._release()
+
+
+def create_hub(event):
+    """BroadcastHub sized from SSE_MAX_CLIENTS"""
+    return BroadcastHub(event, max_clients=int(os.environ.get('SSE_MAX_CLIENTS', 5000)))
@@ -0,0 +1,161 @@
+"""
+Facet bitmaps for Samrat Jewellers
+
+Keeps one boolean array per facet value (category, metal type, purity) plus
+a hidden-state array, indexed by a per-product slot. A filter combination is
+an intersection of arrays, and facet counts for the shop sidebar fall out of
+the same intersections without another pass over the products.
+"""
+
+import threading
+
+import numpy as np
+
+FACET_FIELDS = ('category', 'metal_type', 'purity')
+
+
+def facet_value(field, product):
+    value = product.get(field) or ''
+    # The shop compares metals case-insensitively
+    if field == 'metal_type':
+        return str(value).lower()
+    return value
+
+
+class FacetIndex:
+    """Per-value bitmaps maintained from CatalogSnapshot.subscribe()"""
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.RLock()
+        self._reset(capacity)
+
+    def _reset(self, capacity):
+        self._slots = {}          # product id -> slot
+        self._ids = []            # slot -> product id (None once deleted)
+        self._product_values = {} # product id -> {field: value}
+        self._live = np.zeros(capacity, dtype=bool)
+        self._hidden = np.zeros(capacity, dtype=bool)
+        self._values = {field: {} for field in FACET_FIELDS}
+
+    def apply(self, product_id, product):
+        """CatalogSnapshot subscriber: product_id None means a full reload"""
+        with self._lock:
+            if product_id is None:
+                products = product or {}
+                self._reset(max(1024, len(products)))
+                for key, value in products.items():
+                    self._store(key, value)
+            else:
+                self._store(product_id, product)
+
+    def select(self, filters=None, product_ids=None, include_hidden=False, with_counts=True):
+        """Intersect the requested facet values
+
+        filters maps a facet field to the wanted value (empty values are
+        ignored); product_ids optionally restricts the result, e.g. to search
+        hits. Returns (ids in catalog order, {field: {value: count}}) where each
+        field's counts apply every filter except that field's own.
+        """
+        with self._lock:
+            mask, counts = self.mask(filters, product_ids, include_hidden, with_counts)
+            ids = [self._ids[slot] for slot in np.flatnonzero(mask)]
+        return ids, counts
+
+    def mask(self, filters=None, product_ids=None, include_hidden=False, with_counts=True):
+        """Like select(), but return the matching slots as a boolean array"""
+        filters = {field: value for field, value in (filters or {}).items() if value}
+
+        with self._lock:
+            base = self._live.copy() if include_hidden else self._live & ~self._hidden
+            if product_ids is not None:
+                restrict = np.zeros(len(base), dtype=bool)
+                slots = [self._slots[pid] for pid in product_ids if pid in self._slots]
+                restrict[slots] = True
+                base &= restrict
+
+            field_masks = {}
+            for field, value in filters.items():
+                if field == 'metal_type':
+                    value = str(value).lower()
+                field_masks[field] = self._values[field].get(value)
+                if field_masks[field] is None:
+                    field_masks[field] = np.zeros(len(base), dtype=bool)
+
+            result = base.copy()
+            for mask in field_masks.values():
+                result &= mask
+
+            counts = {}
+            if with_counts:
+                for field in FACET_FIELDS:
+                    others = base.copy()
+                    for other_field, mask in field_masks.items():
+                        if other_field != field:
+                            others &= mask
+                    counts[field] = {value: int(np.count_nonzero(others & mask))
+                                     for value, mask in self._values[field].items() if value}
+
+        return result, counts
+
+    def slot(self, product_id):
+        return self._slots.get(product_id)
+
+    def product_id(self, slot):
+        return self._ids[slot]
+
+    def slot_ids(self):
+        """Product ids by slot (None for deleted slots)"""
+        return self._ids
+
+    def _store(self, product_id, product):
+        slot = self._slots.get(product_id)
+
+        if slot is not None:
+            for field, value in self._product_values.pop(product_id).items():
+                self._values[field][value][slot] = False
+
+        if product is None:
+            if slot is not None:
+                del self._slots[product_id]
+                self._ids[slot] = None
+                self._live[slot] = False
+                self._hidden[slot] = False
+            return
+
+        if slot is None:
+            # Slots are never reused, so slot order stays the catalog's insertion order
+            slot = len(self._ids)
+            self._ensure_capacity(slot + 1)
+            self._ids.append(product_id)
+            self._slots[product_id] = slot
+
+        self._live[slot] = True
+        self._hidden[slot] = bool(product.get('is_hidden', False))
+
+        values = {}
+        for field in FACET_FIELDS:
+            value = facet_value(field, product)
+            mask = self._values[field].get(value)
+            if mask is None:
+                mask = self._values[field][value] = np.zeros(len(self._live), dtype=bool)
+            mask[slot] = True
+            values[field] = value
+        self._product_values[product_id] = values
+
+    def _ensure_capacity(self, size):
+        capacity = len(self._live)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self._live = self._grow(self._live, capacity)
+        self._hidden = self._grow(self._hidden, capacity)
+        for values in self._values.values():
+            for value, mask in values.items():
+                values[value] = self._grow(mask, capacity)
+
+    @staticmethod
+    def _grow(mask, capacity):
+        grown = np.zeros(capacity, dtype=bool)
+        grown[:len(mask)] = mask
+        return grown
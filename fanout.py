@@ -0,0 +1,39 @@
+"""
+Concurrent fan-out of independent reads for Samrat Jewellers
+
+A page that needs several Firebase nodes issues the reads together on a
+shared thread pool, so its latency is close to the slowest read instead of
+the sum of all of them.
+"""
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TIMEOUT = 5.0  # seconds
+
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='fanout')
+
+
+def fetch_parallel(calls, timeout=DEFAULT_TIMEOUT):
+    """Run independent reads concurrently and return {name: result}
+
+    calls maps a name to a callable, or to (callable, timeout) for a per-call
+    timeout. A call that raises or misses its timeout is logged and left out
+    of the result so the caller can fall back to what it already has.
+    """
+    started = time.monotonic()
+    futures = {}
+    for name, call in calls.items():
+        call, call_timeout = call if isinstance(call, tuple) else (call, timeout)
+        # Run in a copy of the caller's context so per-request call counts see it
+        futures[name] = (_pool.submit(contextvars.copy_context().run, call), started + call_timeout)
+
+    results = {}
+    for name, (future, deadline) in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception as e:
+            future.cancel()
+            print(f"Parallel fetch of {name} failed: {e!r}")
+    return results
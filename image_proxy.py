@@ -0,0 +1,319 @@
+"""
+Caching proxy for Google Drive images
+
+Product and category images that live on Google Drive are served from
+/img/<file id> instead of linking shoppers straight to full-size Drive
+originals. Each original is fetched once, resized to the widths images.py
+uses for local uploads, re-encoded for the browser and kept in a bounded
+on-disk LRU cache. Concurrent misses for the same image share one fetch.
+
+    DRIVE_IMAGE_DIR=/path/to/files     # serve originals from a local folder instead of Drive
+    IMAGE_CACHE_DIR=image_cache        # where originals and variants are kept
+    IMAGE_CACHE_MB=512                 # cache size before least recently used files go
+"""
+
+import io
+import os
+import re
+import threading
+import urllib.request
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+from flask import abort, send_file
+from PIL import Image, ImageOps
+
+from images import IMAGE_SIZES, IMAGE_QUALITY, MIME_TYPES, available_formats, run_native
+
+PROXY_PREFIX = '/img/'
+DRIVE_IMAGE_URL = 'https://lh3.googleusercontent.com/d/{}'
+FILE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{10,200}')
+FETCH_TIMEOUT = 15
+MAX_ORIGINAL_BYTES = 25 * 1024 * 1024
+PROXY_MAX_AGE = 30 * 24 * 3600  # Drive files can be replaced in place, so not immutable
+
+
+def drive_file_id(url):
+    """File id from a Drive share link, an lh3 link or a /img/ proxy path, else None"""
+    if not url:
+        return None
+    match = None
+    if url.startswith(PROXY_PREFIX):
+        match = re.match(re.escape(PROXY_PREFIX) + r'([^/?#]+)', url)
+    elif 'drive.google.com' in url:
+        match = re.search(r'/file/d/([^/?#]+)', url) or re.search(r'[?&]id=([^&#]+)', url)
+    elif 'googleusercontent.com/d/' in url:
+        match = re.search(r'googleusercontent\.com/d/([^/?#=]+)', url)
+    if match and FILE_ID_PATTERN.fullmatch(match.group(1)):
+        return match.group(1)
+    return None
+
+
+def document_file_id(document):
+    """Drive file id a product or category shows, normalized or not"""
+    return document.get('image_file_id') or drive_file_id(document.get('image_url'))
+
+
+class ImageReferences:
+    """Drive file ids the catalog's products show, fed by CatalogSnapshot.subscribe()
+
+    The proxy only serves ids found here (or on a category), so /img/ can't
+    be used to fetch arbitrary Drive files through the shop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}          # product id -> file id
+        self._counts = Counter()
+
+    def apply(self, product_id, product):
+        with self._lock:
+            if product_id is None:
+                self._ids = {}
+                self._counts = Counter()
+                for key, document in (product or {}).items():
+                    self._store(key, document)
+            else:
+                self._store(product_id, product)
+
+    def __contains__(self, file_id):
+        with self._lock:
+            return self._counts[file_id] > 0
+
+    def _store(self, product_id, product):
+        old = self._ids.pop(product_id, None)
+        if old:
+            self._counts[old] -= 1
+            if not self._counts[old]:
+                del self._counts[old]
+        file_id = document_file_id(product) if isinstance(product, dict) else None
+        if file_id:
+            self._ids[product_id] = file_id
+            self._counts[file_id] += 1
+
+
+def fetch_drive_image(file_id):
+    """Download the original of a publicly shared Drive image"""
+    request = urllib.request.Request(DRIVE_IMAGE_URL.format(file_id), headers={'User-Agent': 'samrat-jewellers-image-proxy'})
+    with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+        data = response.read(MAX_ORIGINAL_BYTES + 1)
+    if len(data) > MAX_ORIGINAL_BYTES:
+        raise ValueError(f"Drive image {file_id} is larger than {MAX_ORIGINAL_BYTES} bytes")
+    return data
+
+
+def directory_fetcher(folder):
+    """Fetcher reading originals from folder/<file id>[.ext], for tests and offline runs"""
+    def fetch(file_id):
+        for name in sorted(os.listdir(folder)):
+            if name == file_id or os.path.splitext(name)[0] == file_id:
+                with open(os.path.join(folder, name), 'rb') as f:
+                    return f.read()
+        raise FileNotFoundError(f"No local image for {file_id} in {folder}")
+    return fetch
+
+
+def encode_image(data, width, fmt):
+    """data resized down to width and encoded as fmt"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if fmt == 'jpeg' or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB' if fmt == 'jpeg' else 'RGBA')
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt.upper(), quality=IMAGE_QUALITY.get(fmt, 82))
+    return buffer.getvalue()
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class DiskLRU:
+    """Files in a folder, evicting the least recently used past max_bytes"""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # name -> size, least recently used first
+        self.size = 0
+        os.makedirs(folder, exist_ok=True)
+
+        # Pick up what a previous run left, oldest access first
+        files = []
+        for entry in os.scandir(folder):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._index[name] = size
+            self.size += size
+        self._evict()
+
+    def get(self, name):
+        """Path of a cached file, marking it recently used, or None"""
+        with self._lock:
+            if name not in self._index:
+                return None
+            self._index.move_to_end(name)
+        path = os.path.join(self.folder, name)
+        try:
+            # Persist the recency so a restart evicts in the same order
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.size -= self._index.pop(name, 0)
+            return None
+        return path
+
+    def put(self, name, data):
+        path = os.path.join(self.folder, name)
+        partial = f'{path}.{threading.get_ident()}.tmp'
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+        with self._lock:
+            self.size += len(data) - self._index.pop(name, 0)
+            self._index[name] = len(data)
+            self._evict(keep=name)
+        return path
+
+    def _evict(self, keep=None):
+        while self.size > self.max_bytes and self._index:
+            name, size = next(iter(self._index.items()))
+            if name == keep:
+                break
+            del self._index[name]
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+
+
+class ImageProxy:
+    """Fetches, resizes and caches images by Drive file id"""
+
+    def __init__(self, folder='image_cache', fetcher=fetch_drive_image, max_bytes=512 * 1024 * 1024):
+        self.fetcher = fetcher
+        self.cache = DiskLRU(folder, max_bytes)
+        self.widths = sorted(set(IMAGE_SIZES.values()))
+        self.formats = available_formats()
+        self._flights = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def width_for(self, requested):
+        """Smallest served width covering the request, so arbitrary ?w= can't fill the cache"""
+        if not requested:
+            return self.widths[-1]
+        return next((width for width in self.widths if width >= requested), self.widths[-1])
+
+    def format_for(self, accept_mimetypes):
+        for fmt in self.formats:
+            if MIME_TYPES[fmt] in accept_mimetypes:
+                return fmt
+        return 'jpeg'
+
+    def srcset(self, url, url_for_width):
+        """srcset over the served widths for a proxied image, else ''"""
+        file_id = drive_file_id(url)
+        if not file_id:
+            return ''
+        return ', '.join(f'{url_for_width(file_id, width)} {width}w' for width in self.widths)
+
+    def get(self, file_id, width, fmt):
+        """Path of file_id resized to width and encoded as fmt, fetching on a miss"""
+        name = f'{file_id}-{width}.{fmt}'
+        path = self.cache.get(name)
+        with self._stats_lock:
+            if path:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if path:
+            return path
+        return self._flights.do(name, lambda: self._render(file_id, width, fmt, name))
+
+    def send(self, file_id, width, accept_mimetypes):
+        if not FILE_ID_PATTERN.fullmatch(file_id):
+            abort(404)
+        width, fmt = self.width_for(width), self.format_for(accept_mimetypes)
+        # A second try covers the variant being evicted between get() and opening it
+        for attempt in range(2):
+            try:
+                path = self.get(file_id, width, fmt)
+            except Exception as e:
+                print(f"Image proxy failed for {file_id}: {e!r}")
+                abort(502)
+            try:
+                response = send_file(os.path.abspath(path), mimetype=MIME_TYPES.get(fmt, 'image/jpeg'), max_age=PROXY_MAX_AGE)
+                break
+            except FileNotFoundError:
+                if attempt:
+                    abort(502)
+        response.cache_control.public = True
+        response.vary.add('Accept')
+        return response
+
+    def stats(self):
+        with self._stats_lock:
+            return {'hits': self.hits, 'misses': self.misses, 'fetches': self.fetches,
+                    'bytes': self.cache.size, 'max_bytes': self.cache.max_bytes}
+
+    def _original(self, file_id):
+        name = f'{file_id}.orig'
+        path = self.cache.get(name)
+        if path is not None:
+            try:
+                with open(path, 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass  # evicted since get(), so it is fetched again
+        return self._flights.do(name, lambda: self._fetch(file_id, name))
+
+    def _fetch(self, file_id, name):
+        data = self.fetcher(file_id)
+        with self._stats_lock:
+            self.fetches += 1
+        self.cache.put(name, data)
+        return data
+
+    def _render(self, file_id, width, fmt, name):
+        return self.cache.put(name, run_native(encode_image, self._original(file_id), width, fmt))
+
+
+def create_image_proxy():
+    """ImageProxy configured from DRIVE_IMAGE_DIR, IMAGE_CACHE_DIR and IMAGE_CACHE_MB"""
+    folder = os.environ.get('DRIVE_IMAGE_DIR')
+    fetcher = directory_fetcher(folder) if folder else fetch_drive_image
+    return ImageProxy(os.environ.get('IMAGE_CACHE_DIR', 'image_cache'), fetcher,
+                      max_bytes=int(float(os.environ.get('IMAGE_CACHE_MB', 512)) * 1024 * 1024))
@@ -0,0 +1,232 @@
+"""
+Image derivative pipeline for Samrat Jewellers
+
+Uploaded and shipped images are resized to thumbnail, card and detail
+widths and re-encoded as WebP (and AVIF when Pillow supports it) under
+content-hashed names, so they can be cached forever and shop cards download
+kilobytes instead of megabyte PNGs. Work runs on a small background pool;
+templates read the finished variants from a JSON manifest and fall back to
+the original file until they exist.
+
+    python images.py backfill           # derive every image under static/images
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+try:
+    from gevent import get_hub, monkey as gevent_monkey
+    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+except ImportError:
+    gevent_monkey = None
+
+IMAGE_SIZES = {'thumb': 200, 'card': 480, 'detail': 1200}
+# Preferred first; formats this Pillow build can't encode are skipped
+IMAGE_FORMATS = ('avif', 'webp')
+IMAGE_QUALITY = {'avif': 55, 'webp': 78}
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+MANIFEST_CHECK_INTERVAL = 5  # seconds between manifest mtime checks
+
+
+def run_native(fn, *args):
+    """fn(*args), on gevent's native thread pool when gevent is serving
+
+    Encoding, hashing and compressing on a request greenlet would stall
+    every other open connection until it finished.
+    """
+    if gevent_monkey and gevent_monkey.is_module_patched('threading'):
+        return get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def available_formats():
+    return tuple(fmt for fmt in IMAGE_FORMATS if features.check(fmt))
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ImagePipeline:
+    """Derives resized variants of images under static_folder"""
+
+    def __init__(self, static_folder='static', output='images/derived', workers=2):
+        self.static_folder = static_folder
+        self.output = output
+        self.formats = available_formats()
+        self._manifest_path = os.path.join(static_folder, output, 'manifest.json')
+        self._manifest = {}
+        self._manifest_mtime = None
+        self._manifest_digest = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        if gevent_monkey and gevent_monkey.is_module_patched('threading'):
+            # Under gevent, encoding on greenlets would stall every open connection
+            self._pool = NativeThreadPoolExecutor(max_workers=workers)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+
+    def submit(self, path):
+        """Queue path (relative to static_folder) for processing"""
+        with self._lock:
+            if path in self._pending:
+                return None
+            self._pending.add(path)
+        return self._pool.submit(self._process, path)
+
+    def backfill(self, folder='images'):
+        """Queue every source image under folder; returns the futures"""
+        futures = []
+        root = os.path.join(self.static_folder, folder)
+        for directory, _, filenames in os.walk(root):
+            if os.path.abspath(directory).startswith(os.path.abspath(os.path.join(self.static_folder, self.output))):
+                continue
+            for filename in sorted(filenames):
+                if filename.lower().endswith(SOURCE_EXTENSIONS):
+                    path = os.path.relpath(os.path.join(directory, filename), self.static_folder)
+                    future = self.submit(path.replace(os.sep, '/'))
+                    if future is not None:
+                        futures.append(future)
+        return futures
+
+    @property
+    def version(self):
+        """Hash of the manifest, for cache keys; the same wherever it is shared"""
+        self._reload_manifest()
+        return self._manifest_digest
+
+    def variants(self, path):
+        """Manifest entry for path, or None until its variants exist"""
+        self._reload_manifest()
+        return self._manifest.get(path)
+
+    def sources(self, path, url_for_static):
+        """[{'type': mime, 'srcset': '... 480w, ...'}] for a <picture> element"""
+        entry = self.variants(path)
+        if not entry:
+            return []
+        return [{'type': MIME_TYPES[fmt],
+                 'srcset': ', '.join(f'{url_for_static(name)} {width}w' for name, width in entry['variants'][fmt])}
+                for fmt in self.formats if entry['variants'].get(fmt)]
+
+    def _process(self, path):
+        try:
+            return self.derive(path)
+        except Exception as e:
+            print(f"Image derivation failed for {path}: {e!r}")
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def derive(self, path):
+        """Write every size/format variant of path and record it in the manifest"""
+        source = os.path.join(self.static_folder, path)
+        if not os.path.getsize(source):
+            return None
+
+        digest = content_hash(source)
+        self._reload_manifest()
+        current = self._manifest.get(path)
+        if current and current['hash'] == digest and self._files_exist(current):
+            return current
+
+        stem = re.sub(r'[^A-Za-z0-9_-]+', '-', os.path.splitext(os.path.basename(path))[0]).strip('-').lower() or 'image'
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            original_width, original_height = image.size
+
+            # Never upscale; sizes wider than the original collapse into one variant
+            widths = sorted({min(width, original_width) for width in IMAGE_SIZES.values()})
+            variants = {fmt: [] for fmt in self.formats}
+            for width in widths:
+                height = max(1, round(original_height * width / original_width))
+                resized = image if width == original_width else image.resize((width, height), Image.LANCZOS)
+                for fmt in self.formats:
+                    name = f'{self.output}/{stem}-{digest}-{width}.{fmt}'
+                    target = os.path.join(self.static_folder, name)
+                    if not os.path.exists(target):
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        partial = f'{target}.{os.getpid()}.tmp'
+                        resized.save(partial, format=fmt.upper(), quality=IMAGE_QUALITY[fmt])
+                        os.replace(partial, target)
+                    variants[fmt].append((name, width))
+
+        entry = {'hash': digest, 'width': original_width, 'height': original_height, 'variants': variants}
+        self._record(path, entry)
+        return entry
+
+    def _files_exist(self, entry):
+        return all(os.path.exists(os.path.join(self.static_folder, name))
+                   for fmt in self.formats for name, _ in entry['variants'].get(fmt, []))
+
+    def _record(self, path, entry):
+        with self._lock:
+            self._load_manifest()
+            self._manifest = dict(self._manifest, **{path: entry})
+            os.makedirs(os.path.dirname(self._manifest_path), exist_ok=True)
+            partial = f'{self._manifest_path}.{os.getpid()}.tmp'
+            data = json.dumps(self._manifest, indent=1, sort_keys=True).encode()
+            with open(partial, 'wb') as f:
+                f.write(data)
+            os.replace(partial, self._manifest_path)
+            self._manifest_mtime = os.path.getmtime(self._manifest_path)
+            self._manifest_digest = hashlib.sha1(data).hexdigest()[:12]
+
+    def _reload_manifest(self):
+        # Another process (the backfill command) may have written new entries
+        now = time.monotonic()
+        if now - self._checked_at < MANIFEST_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        with self._lock:
+            self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            mtime = os.path.getmtime(self._manifest_path)
+        except OSError:
+            return
+        if mtime != self._manifest_mtime:
+            with open(self._manifest_path, 'rb') as f:
+                data = f.read()
+            self._manifest = json.loads(data)
+            self._manifest_mtime = mtime
+            self._manifest_digest = hashlib.sha1(data).hexdigest()[:12]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Derive WebP/AVIF image variants')
+    parser.add_argument('command', choices=('backfill',))
+    parser.add_argument('--static', default='static', help='static folder')
+    parser.add_argument('--folder', default='images', help='folder under static to scan')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    pipeline = ImagePipeline(args.static, workers=args.workers)
+    print(f"Formats: {', '.join(pipeline.formats) or 'none available'}")
+    started = time.perf_counter()
+    futures = pipeline.backfill(args.folder)
+    done = sum(1 for future in futures if future.result())
+    print(f"✓ Derived {done} of {len(futures)} images in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
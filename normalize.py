@@ -0,0 +1,178 @@
+"""
+Write-time normalization for Samrat Jewellers
+
+Products and categories are cleaned up once when an admin saves them instead
+of on every page view: numeric fields are stored as numbers, Google Drive
+links in one canonical form with their file id alongside, and products carry
+their search terms. Readers (the search index, templates, the image proxy)
+use the stored fields and fall back to computing them for older documents.
+
+    python normalize.py backfill            # normalize the existing tree in resumable chunks
+"""
+
+import math
+import time
+
+from image_proxy import DRIVE_IMAGE_URL, drive_file_id
+from search_index import product_terms
+
+# Bump when the normalized shape changes so the backfill runs again
+NORMALIZED_VERSION = 1
+
+PRODUCT_STRINGS = ('name', 'sku', 'category', 'description', 'purity')
+PRODUCT_NUMBERS = ('weight', 'weight_in_grams', 'base_price', 'making_charges')
+PRICE_TYPES = ('fixed', 'per_gram')
+MAKING_CHARGES_TYPES = ('rupees', 'percent')
+FORM_NUMBER_LABELS = {'weight': 'Weight', 'base_price': 'Price', 'making_charges': 'Making charges'}
+
+BACKFILL_NODES = ('products', 'categories')
+CHECKPOINT_KEY = 'normalize_backfill'
+
+
+def to_number(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def normalize_image(document):
+    """Store Drive links as one canonical URL plus their file id"""
+    url = (document.get('image_url') or '').strip()
+    file_id = drive_file_id(url)
+    document['image_url'] = DRIVE_IMAGE_URL.format(file_id) if file_id else url
+    if file_id:
+        document['image_file_id'] = file_id
+    else:
+        document.pop('image_file_id', None)
+
+
+def normalize_product(product):
+    """Normalized copy of a product document; the input is left untouched"""
+    product = dict(product)
+    for field in PRODUCT_STRINGS:
+        product[field] = str(product.get(field) or '').strip()
+    product['metal_type'] = str(product.get('metal_type') or '').strip().lower()
+    # An unknown price_type is kept as stored; rewriting it would reprice
+    # the product, and the admin form rejects new ones (product_errors)
+    if product.get('making_charges_type') not in MAKING_CHARGES_TYPES:
+        product['making_charges_type'] = 'rupees'
+
+    # The forms fill weight and weight_in_grams from one field; older
+    # documents may only have one of them
+    if product.get('weight') in (None, '') and product.get('weight_in_grams') not in (None, ''):
+        product['weight'] = product['weight_in_grams']
+    if product.get('weight_in_grams') in (None, ''):
+        product['weight_in_grams'] = product.get('weight')
+    for field in PRODUCT_NUMBERS:
+        product[field] = to_number(product.get(field))
+
+    product['is_hidden'] = to_bool(product.get('is_hidden'))
+    normalize_image(product)
+    product.pop('search_terms', None)
+    product['search_terms'] = sorted(product_terms(product))
+    product['normalized_version'] = NORMALIZED_VERSION
+    return product
+
+
+def product_errors(form):
+    """Messages for an admin product form that must not be saved, else []"""
+    errors = []
+    price_type = form.get('price_type')
+    if price_type not in PRICE_TYPES:
+        errors.append(f"Unknown price type: {price_type}")
+    fields = ('weight', 'base_price', 'making_charges') if price_type == 'fixed' else ('weight', 'making_charges')
+    for field in fields:
+        value = form.get(field)
+        number = None if value is None or not str(value).strip() else to_number(value, None)
+        if number is None or not math.isfinite(number) or number < 0:
+            errors.append(f"{FORM_NUMBER_LABELS[field]} must be a number of 0 or more")
+    return errors
+
+
+def normalize_category(category):
+    """Normalized copy of a category document"""
+    category = dict(category)
+    category['name'] = str(category.get('name') or '').strip()
+    category['is_hidden'] = to_bool(category.get('is_hidden'))
+    normalize_image(category)
+    category['normalized_version'] = NORMALIZED_VERSION
+    return category
+
+
+NORMALIZERS = {'products': normalize_product, 'categories': normalize_category}
+
+
+def backfill(repos, nodes=BACKFILL_NODES, chunk_size=200, restart=False, log=print):
+    """Normalize every document of nodes, resuming from the saved checkpoint
+
+    Each chunk's documents and the checkpoint are written in one multi-path
+    update, so an interrupted run picks up after the last chunk it finished.
+    """
+    totals = {}
+    for node in nodes:
+        repository = getattr(repos, node)
+        normalize = NORMALIZERS[node]
+        checkpoint_path = f'{CHECKPOINT_KEY}/{node}'
+        checkpoint = None if restart else repos.meta.get(checkpoint_path)
+        if not checkpoint or checkpoint.get('version') != NORMALIZED_VERSION:
+            checkpoint = {'version': NORMALIZED_VERSION, 'after': None, 'done': False, 'scanned': 0, 'written': 0}
+        if checkpoint.get('done'):
+            log(f"✓ {node}: already normalized (version {NORMALIZED_VERSION})")
+            totals[node] = checkpoint
+            continue
+        if checkpoint.get('after') is not None:
+            log(f"  {node}: resuming after {checkpoint['after']}")
+
+        while True:
+            items = repository.chunk(checkpoint.get('after'), chunk_size)
+            updates = {}
+            for key, document in items:
+                if not isinstance(document, dict):
+                    continue
+                normalized = normalize(document)
+                if normalized != document:
+                    updates[f'{node}/{key}'] = normalized
+            checkpoint['scanned'] += len(items)
+            checkpoint['written'] += len(updates)
+            if items:
+                checkpoint['after'] = items[-1][0]
+            checkpoint['done'] = len(items) < chunk_size
+            checkpoint['updated_at'] = time.time()
+            updates[f'meta/{checkpoint_path}'] = checkpoint
+            repos.update_paths(updates)
+            log(f"  {node}: {checkpoint['scanned']} scanned, {checkpoint['written']} rewritten")
+            if checkpoint['done']:
+                break
+        log(f"✓ {node}: {checkpoint['scanned']} documents, {checkpoint['written']} rewritten")
+        totals[node] = checkpoint
+    return totals
+
+
+def main():
+    import argparse
+
+    from repositories import Repositories
+    from storage import create_backend
+
+    parser = argparse.ArgumentParser(description='Normalize stored products and categories')
+    parser.add_argument('command', choices=('backfill',))
+    parser.add_argument('--chunk', type=int, default=200, help='documents per read and write')
+    parser.add_argument('--node', action='append', choices=BACKFILL_NODES, help='only this node (repeatable)')
+    parser.add_argument('--restart', action='store_true', help='ignore the saved checkpoint')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    backfill(Repositories(create_backend()), nodes=args.node or BACKFILL_NODES,
+             chunk_size=args.chunk, restart=args.restart)
+    print(f"✓ Backfill finished in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
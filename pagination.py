@@ -0,0 +1,150 @@
+"""
+Keyset pagination for Samrat Jewellers
+
+Keeps one in-memory ordering of facet slots per sort mode and pages through
+it with an opaque cursor holding the last (sort key, product id) seen. A
+page is a bisect plus a forward scan of the filter mask, so page N costs the
+same as page 1.
+"""
+
+import base64
+import bisect
+import json
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+SORT_MODES = ('', 'name', 'price-low', 'price-high', 'category')
+
+Page = namedtuple('Page', ['product_ids', 'next_cursor', 'total', 'facet_counts'])
+
+
+def encode_cursor(sort, key, product_id):
+    raw = json.dumps([sort, key, product_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(sort, key, product_id) of a cursor, or None when it is malformed or forged"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, key, product_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    # Sort keys are names, categories or prices; anything else would reach
+    # dict lookups and comparisons that can't handle it
+    if not isinstance(sort, str) or not isinstance(product_id, str):
+        return None
+    if isinstance(key, bool) or not isinstance(key, (str, int, float)):
+        return None
+    return sort, key, product_id
+
+
+class _Ordering:
+    def __init__(self, keys, slots):
+        self.keys = keys      # sorted (sort key, slot) pairs
+        self.slots = slots    # the same slots as a NumPy array
+
+
+class Paginator:
+    """Sorted slot orderings over a FacetIndex, rebuilt when the data version moves"""
+
+    def __init__(self, catalog, facet_index, price_engine, scan_chunk=256):
+        self._catalog = catalog
+        self._facets = facet_index
+        self._prices = price_engine
+        self._scan_chunk = scan_chunk
+        self._lock = threading.Lock()
+        self._orderings = {}    # sort -> (version, _Ordering)
+        self._slot_prices = (None, None)
+
+    def page(self, sort='', filters=None, search_ids=None, price_range=None,
+             cursor=None, limit=24, include_hidden=False):
+        if sort not in SORT_MODES:
+            sort = ''
+
+        mask, facet_counts = self._facets.mask(filters, product_ids=search_ids, include_hidden=include_hidden)
+
+        if price_range:
+            min_price, max_price = price_range
+            prices = self._price_by_slot(len(mask))
+            mask &= (prices >= min_price) & (prices <= max_price)
+
+        ordering = self._ordering(sort)
+        start = self._cursor_position(ordering, sort, cursor)
+
+        # Scan forward in chunks until one extra hit tells us there is a next page
+        positions = []
+        position = start
+        while len(positions) <= limit and position < len(ordering.slots):
+            chunk = ordering.slots[position:position + self._scan_chunk]
+            found = np.flatnonzero(mask[chunk])[:limit + 1 - len(positions)]
+            positions.extend((found + position).tolist())
+            position += self._scan_chunk
+
+        next_cursor = None
+        if len(positions) > limit:
+            positions = positions[:limit]
+            last_key, last_slot = ordering.keys[positions[-1]]
+            next_cursor = encode_cursor(sort, last_key, self._facets.product_id(last_slot))
+
+        product_ids = [self._facets.product_id(ordering.keys[p][1]) for p in positions]
+        return Page(product_ids, next_cursor, int(np.count_nonzero(mask)), facet_counts)
+
+    def _cursor_position(self, ordering, sort, cursor):
+        decoded = decode_cursor(cursor) if cursor else None
+        if not decoded or decoded[0] != sort:
+            return 0
+        _, key, product_id = decoded
+        slot = self._facets.slot(product_id)
+        # A deleted cursor product resumes after every entry sharing its key
+        tiebreak = slot if slot is not None else float('inf')
+        try:
+            return bisect.bisect_right(ordering.keys, (key, tiebreak))
+        except TypeError:
+            return 0
+
+    def _version(self, sort):
+        if sort in ('price-low', 'price-high'):
+            return (self._catalog.version, self._prices.version)
+        return (self._catalog.version,)
+
+    def _ordering(self, sort):
+        version = self._version(sort)
+        with self._lock:
+            cached = self._orderings.get(sort)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            products = self._catalog.products()
+            slot_ids = self._facets.slot_ids()
+            live = [(slot, pid) for slot, pid in enumerate(slot_ids) if pid is not None and pid in products]
+
+            if sort in ('price-low', 'price-high'):
+                prices = self._prices.prices_for([pid for _, pid in live])
+                prices = np.nan_to_num(prices)
+                if sort == 'price-high':
+                    prices = -prices
+                keys = [(float(price), slot) for price, (slot, _) in zip(prices, live)]
+            elif sort in ('name', 'category'):
+                keys = [(str(products[pid].get(sort, '') or ''), slot) for slot, pid in live]
+            else:
+                keys = [(0, slot) for slot, _ in live]
+
+            keys.sort()
+            ordering = _Ordering(keys, np.array([slot for _, slot in keys], dtype=np.int64))
+            self._orderings[sort] = (version, ordering)
+            return ordering
+
+    def _price_by_slot(self, size):
+        version = (self._catalog.version, self._prices.version)
+        with self._lock:
+            cached_version, prices = self._slot_prices
+            if cached_version != version or len(prices) != size:
+                slot_ids = self._facets.slot_ids()
+                prices = np.full(size, np.nan)
+                known = self._prices.prices_for([pid for pid in slot_ids])
+                prices[:len(known)] = known[:size]
+                self._slot_prices = (version, prices)
+            return prices
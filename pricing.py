@@ -0,0 +1,156 @@
+"""
+Vectorized price engine for Samrat Jewellers
+
+Keeps the pricing inputs of every product in columnar NumPy arrays and
+recomputes all calculated prices in one batched pass whenever the metal
+rates or a product change. Routes read the precomputed prices.
+"""
+
+import threading
+
+import numpy as np
+
+PRICE_FIXED = 0
+PRICE_PER_GRAM = 1
+PRICE_OTHER = 2
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PriceEngine:
+    """Columnar price table fed by CatalogSnapshot.subscribe()"""
+
+    def __init__(self, rates_loader, capacity=1024):
+        self._rates_loader = rates_loader
+        self._rates = None
+        self._lock = threading.RLock()
+        self.version = 0        # moves on every recompute, product writes included
+        self.rates_version = 0  # moves only once prices follow new rates
+
+        self._rows = {}        # product id -> row
+        self._ids = []         # row -> product id (None for free rows)
+        self._free = []
+        self._metals = {}      # metal name -> metal code
+
+        self._price_type = np.full(capacity, PRICE_OTHER, dtype=np.int8)
+        self._metal = np.full(capacity, -1, dtype=np.int32)
+        self._weight = np.zeros(capacity)
+        self._base_price = np.zeros(capacity)
+        self._making = np.zeros(capacity)
+        self._making_percent = np.zeros(capacity, dtype=bool)
+        self._prices = np.zeros(capacity)
+
+    @property
+    def rates(self):
+        """Current metal rates, loaded once and then replaced by set_rates()"""
+        if self._rates is None:
+            self.set_rates(self._rates_loader() or {})
+        return self._rates
+
+    def set_rates(self, rates):
+        with self._lock:
+            self._rates = rates
+            self._recompute()
+            self.rates_version += 1
+
+    def apply(self, product_id, product):
+        """CatalogSnapshot subscriber: product_id None means a full reload"""
+        with self._lock:
+            if product_id is None:
+                self._load(product or {})
+            else:
+                self._store(product_id, product)
+            self._recompute()
+
+    def price(self, product_id):
+        self.rates  # prices are all zero until the rates are loaded
+        with self._lock:
+            row = self._rows.get(product_id)
+            if row is None:
+                return None
+            return float(self._prices[row])
+
+    def prices_for(self, product_ids):
+        """Prices for product_ids as an array, NaN where a product is unknown"""
+        self.rates  # loads the rates on first use, like price()
+        with self._lock:
+            rows = np.fromiter((self._rows.get(pid, -1) for pid in product_ids), dtype=np.int64)
+            prices = self._prices[rows]
+        prices[rows < 0] = np.nan
+        return prices
+
+    def _load(self, products):
+        self._rows = {}
+        self._ids = []
+        self._free = []
+        self._ensure_capacity(len(products))
+        for product_id, product in products.items():
+            self._store(product_id, product)
+
+    def _store(self, product_id, product):
+        row = self._rows.get(product_id)
+
+        if product is None:
+            if row is not None:
+                del self._rows[product_id]
+                self._ids[row] = None
+                self._free.append(row)
+                self._price_type[row] = PRICE_OTHER
+                self._base_price[row] = 0.0
+            return
+
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._ids[row] = product_id
+            else:
+                row = len(self._ids)
+                self._ensure_capacity(row + 1)
+                self._ids.append(product_id)
+            self._rows[product_id] = row
+
+        price_type = product.get('price_type')
+        self._price_type[row] = {'fixed': PRICE_FIXED, 'per_gram': PRICE_PER_GRAM}.get(price_type, PRICE_OTHER)
+        self._metal[row] = self._metals.setdefault(product.get('metal_type'), len(self._metals))
+        self._weight[row] = _number(product.get('weight'))
+        self._base_price[row] = _number(product.get('base_price'))
+        self._making[row] = _number(product.get('making_charges'))
+        self._making_percent[row] = product.get('making_charges_type') == 'percent'
+
+    def _ensure_capacity(self, size):
+        capacity = len(self._prices)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('_price_type', '_metal', '_weight', '_base_price', '_making', '_making_percent', '_prices'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _recompute(self):
+        """One batched pass over every row, mirroring calculate_price()"""
+        if self._rates is None:
+            return
+
+        # Rate per metal code; NaN where the metal has no rate
+        metal_rates = np.full(len(self._metals) + 1, np.nan)
+        for metal, code in self._metals.items():
+            if metal in self._rates:
+                metal_rates[code] = _number(self._rates[metal].get('rate_per_gram'))
+
+        per_gram_cost = metal_rates[self._metal] * self._weight
+        cost = np.where(self._price_type == PRICE_PER_GRAM, per_gram_cost, self._base_price)
+        making = np.where(self._making_percent, cost * (self._making / 100), self._making)
+        prices = np.round(cost + making, 2)
+
+        # Other price types and per-gram products without a rate fall back to base_price
+        fallback = (self._price_type == PRICE_OTHER) | np.isnan(prices)
+        self._prices = np.where(fallback, self._base_price, prices)
+        self.version += 1
@@ -0,0 +1,266 @@
+"""
+Metal rate history for Samrat Jewellers
+
+metal_rates only holds the current rates, so every update is also appended
+to rate_history as one small record per metal and timestamp, bucketed by
+month. Daily and weekly open/high/low/close summaries are kept up to date as
+records arrive, bucketed by year, so a one-year chart reads one or two
+nodes of a few hundred points instead of every update ever made.
+
+    rate_history/raw/<metal>/<YYYY-MM>/<ms>      {r: rate, s: source}
+    rate_history/daily/<YYYY>/<YYYY-MM-DD>       {<metal>: {o, h, l, c, n, a, z}}
+    rate_history/weekly/<YYYY>/<YYYY-Www>        same, by ISO week
+
+a and z are the times (ms) of the open and close records, so records that
+arrive out of order still land in the right place.
+
+    python rate_history.py rebuild     # recompute the daily and weekly summaries from the raw records (offline)
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from fanout import fetch_parallel
+
+# Days and weeks follow the shop's local time rather than the server's
+RATE_TIMEZONE = timezone(timedelta(hours=5, minutes=30))
+RESOLUTIONS = ('raw', 'daily', 'weekly')
+RAW_MAX_DAYS = 31     # longer ranges are served from the summaries
+DAILY_MAX_DAYS = 400
+
+
+def local_time(at):
+    return datetime.fromtimestamp(at, RATE_TIMEZONE)
+
+
+def month_key(moment):
+    return moment.strftime('%Y-%m')
+
+
+def day_key(moment):
+    return moment.strftime('%Y-%m-%d')
+
+
+def week_key(moment):
+    year, week, _ = moment.isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def period_path(resolution, moment):
+    """Summary node of moment: 'daily/2025/2025-03-14' or 'weekly/2025/2025-W11'"""
+    if resolution == 'daily':
+        return f'daily/{moment.year}/{day_key(moment)}'
+    return f'weekly/{moment.isocalendar()[0]}/{week_key(moment)}'
+
+
+def merge_rate(summary, rate, ms):
+    """Fold one record into an open/high/low/close summary"""
+    if not summary:
+        return {'o': rate, 'h': rate, 'l': rate, 'c': rate, 'n': 1, 'a': ms, 'z': ms}
+    summary = dict(summary)
+    summary['h'] = max(summary['h'], rate)
+    summary['l'] = min(summary['l'], rate)
+    summary['n'] = summary.get('n', 0) + 1
+    if ms < summary['a']:
+        summary['o'], summary['a'] = rate, ms
+    if ms >= summary['z']:
+        summary['c'], summary['z'] = rate, ms
+    return summary
+
+
+def rate_records(rates):
+    """(metal, rate, source) for each metal of a metal_rates document"""
+    for metal, data in sorted(rates.items()):
+        if isinstance(data, dict) and data.get('rate_per_gram') is not None:
+            yield metal, float(data['rate_per_gram']), data.get('source', 'Manual')
+
+
+class RateHistory:
+    """Append-only rate records plus their daily and weekly summaries"""
+
+    def __init__(self, repos):
+        self.repos = repos
+        self.repository = repos.rate_history
+
+    def entries(self, rates, at):
+        """{path: record} appending rates at time at, for a multi-path update
+
+        The caller writes these together with the new metal_rates document,
+        so the current rates and their history can't disagree.
+        """
+        moment = local_time(at)
+        ms = int(at * 1000)
+        node = self.repository.node
+        return {f'{node}/raw/{metal}/{month_key(moment)}/{ms:013d}': {'r': rate, 's': source}
+                for metal, rate, source in rate_records(rates)}
+
+    def summarize(self, rates, at):
+        """Fold rates recorded at time at into their day and week"""
+        moment = local_time(at)
+        ms = int(at * 1000)
+        records = list(rate_records(rates))
+
+        def fold(current):
+            current = dict(current or {})
+            for metal, rate, _ in records:
+                current[metal] = merge_rate(current.get(metal), rate, ms)
+            return current
+
+        # Transactions, as two admins may save rates at the same moment
+        for resolution in ('daily', 'weekly'):
+            self.repository.ref(period_path(resolution, moment)).transaction(fold)
+
+    def record(self, rates, at=None):
+        at = time.time() if at is None else at
+        self.repos.update_paths(self.entries(rates, at))
+        self.summarize(rates, at)
+
+    def points(self, metal, start, end):
+        """[{at, rate, source}] of every record of metal between start and end"""
+        first, last = local_time(start), local_time(end)
+        months = []
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            months.append(f'{year}-{month:02d}')
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        buckets = fetch_parallel({key: partial(self.repository.get, f'raw/{metal}/{key}') for key in months})
+        low, high = int(start * 1000), int(end * 1000)
+        points = []
+        for key in months:
+            for ms, record in (buckets.get(key) or {}).items():
+                if low <= int(ms) <= high and isinstance(record, dict):
+                    points.append((int(ms), record))
+        points.sort(key=lambda item: item[0])
+        return [{'at': local_time(ms / 1000).isoformat(timespec='seconds'), 'rate': record.get('r'),
+                 'source': record.get('s')} for ms, record in points]
+
+    def summaries(self, metal, resolution, start, end):
+        """[{at, rate, open, high, low, count}] per day or week of metal, rate being the close"""
+        first, last = local_time(start), local_time(end)
+        if resolution == 'daily':
+            years = range(first.year, last.year + 1)
+            low, high = day_key(first), day_key(last)
+        else:
+            years = range(first.isocalendar()[0], last.isocalendar()[0] + 1)
+            low, high = week_key(first), week_key(last)
+
+        buckets = fetch_parallel({year: partial(self.repository.get, f'{resolution}/{year}') for year in years})
+        points = []
+        for year in years:
+            for period, metals in sorted((buckets.get(year) or {}).items()):
+                summary = metals.get(metal) if isinstance(metals, dict) else None
+                if summary and low <= period <= high:
+                    points.append({'at': period, 'rate': summary['c'], 'open': summary['o'],
+                                   'high': summary['h'], 'low': summary['l'], 'count': summary.get('n', 1)})
+        return points
+
+    def window(self, days=365, resolution=None, now=None):
+        """(resolution, start, end) of the last days, start on a whole minute"""
+        end = time.time() if now is None else now
+        start = (end - days * 86400) // 60 * 60
+        if resolution not in RESOLUTIONS:
+            resolution = 'raw' if days <= RAW_MAX_DAYS else 'daily' if days <= DAILY_MAX_DAYS else 'weekly'
+        return resolution, start, end
+
+    def window_key(self, days=365, resolution=None, now=None):
+        """What moves a series' range on, apart from new records
+
+        Raw ranges drop old records as their start moves (once a minute);
+        summaries change when the first or last day or week does, in the
+        shop's time zone. New records come with new current rates, so a
+        cache key also needs the rates.
+        """
+        resolution, start, end = self.window(days, resolution, now)
+        if resolution == 'raw':
+            return resolution, start
+        first, last = local_time(start), local_time(end)
+        if resolution == 'daily':
+            return resolution, day_key(first), day_key(last)
+        return resolution, week_key(first), week_key(last)
+
+    def series(self, metal, days=365, resolution=None, now=None):
+        """Points of metal over the last days, at a resolution suiting the range"""
+        resolution, start, end = self.window(days, resolution, now)
+        if resolution == 'raw':
+            points = self.points(metal, start, end)
+        else:
+            points = self.summaries(metal, resolution, start, end)
+        return {'metal': metal, 'days': days, 'resolution': resolution, 'points': points}
+
+    def rebuild(self, log=print):
+        """Recompute every daily and weekly summary from the raw records
+
+        The summaries are replaced in one update, so readers never see them
+        missing. A rate saved while this runs may be left out of them, so run
+        it when no admin is updating rates (it is an offline repair command).
+        """
+        raw = self.repository.get('raw') or {}
+        summaries = {'daily': {}, 'weekly': {}}
+        count = 0
+        for metal, months in raw.items():
+            for records in (months or {}).values():
+                for ms, record in (records or {}).items():
+                    if not isinstance(record, dict) or record.get('r') is None:
+                        continue
+                    moment = local_time(int(ms) / 1000)
+                    for resolution, periods in summaries.items():
+                        path = period_path(resolution, moment)
+                        metals = periods.setdefault(path, {})
+                        metals[metal] = merge_rate(metals.get(metal), float(record['r']), int(ms))
+                    count += 1
+
+        # Whole daily and weekly trees, as Firebase rejects a multi-path update
+        # that sets a node and its children
+        trees = {'daily': {}, 'weekly': {}}
+        for periods in summaries.values():
+            for path, metals in periods.items():
+                resolution, year, period = path.split('/')
+                trees[resolution].setdefault(year, {})[period] = metals
+        node = self.repository.node
+        self.repos.update_paths({f'{node}/{resolution}': tree or None for resolution, tree in trees.items()})
+        log(f"✓ Rebuilt {len(summaries['daily'])} days and {len(summaries['weekly'])} weeks from {count} records")
+        return count
+
+
+def chart_geometry(points, width=600, height=160, padding=8):
+    """SVG polyline/polygon coordinates for a series: the close line and the high-low band"""
+    values = [point['rate'] for point in points if point.get('rate') is not None]
+    if not values:
+        return None
+    lows = [point.get('low', point['rate']) for point in points]
+    highs = [point.get('high', point['rate']) for point in points]
+    bottom, top = min(lows), max(highs)
+    span = (top - bottom) or 1.0
+    step = (width - 2 * padding) / max(len(points) - 1, 1)
+
+    def y(value):
+        return round(height - padding - (value - bottom) / span * (height - 2 * padding), 1)
+
+    xs = [round(padding + i * step, 1) for i in range(len(points))]
+    line = ' '.join(f'{x},{y(point["rate"])}' for x, point in zip(xs, points))
+    band = ' '.join([f'{x},{y(high)}' for x, high in zip(xs, highs)] +
+                    [f'{x},{y(low)}' for x, low in reversed(list(zip(xs, lows)))])
+    return {'width': width, 'height': height, 'line': line, 'band': band,
+            'min': bottom, 'max': top, 'first': values[0], 'last': values[-1],
+            'start': points[0]['at'], 'end': points[-1]['at']}
+
+
+def main():
+    import argparse
+
+    from repositories import Repositories
+    from storage import create_backend
+
+    parser = argparse.ArgumentParser(description='Maintain the metal rate history')
+    parser.add_argument('command', choices=('rebuild',))
+    parser.parse_args()
+
+    started = time.perf_counter()
+    RateHistory(Repositories(create_backend())).rebuild()
+    print(f"✓ Finished in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Repositories for Samrat Jewellers
+
+Named accessors for each node of the data tree (products, categories, metal
+rates, settings, customers, wishlists, ...) on top of a storage backend, so
+routes say what they read or write instead of building reference paths.
+"""
+
+# Characters Firebase doesn't allow in keys
+INVALID_KEY_CHARACTERS = '.$#[]/'
+
+
+def is_valid_key(key):
+    return isinstance(key, str) and bool(key) and not any(c in key for c in INVALID_KEY_CHARACTERS)
+
+
+class NodeRepository:
+    """Keyed children of one top-level node"""
+
+    def __init__(self, backend, node):
+        self.backend = backend
+        self.node = node
+
+    def ref(self, key=None):
+        path = self.node if key is None else f'{self.node}/{key}'
+        return self.backend.reference(path)
+
+    def all(self):
+        return self.ref().get() or {}
+
+    def chunk(self, after=None, limit=500):
+        """[(key, value)] for up to limit children after key `after`, in key order"""
+        return self.backend.children(self.node, after, limit)
+
+    def find(self, field, value):
+        """{key: value} of the children whose field equals value"""
+        return self.backend.children_equal(self.node, field, value)
+
+    def get(self, key):
+        return self.ref(key).get()
+
+    def put(self, key, value):
+        self.ref(key).set(value)
+
+    def update(self, key, changes):
+        self.ref(key).update(changes)
+
+    def delete(self, key):
+        self.ref(key).delete()
+
+    def replace_all(self, value):
+        self.ref().set(value)
+
+    def create(self, key, value):
+        """Atomically insert key; returns False if it already exists"""
+        created = []
+
+        def insert_if_absent(current):
+            del created[:]
+            if current is not None:
+                return current
+            created.append(True)
+            return value
+
+        self.ref(key).transaction(insert_if_absent)
+        return bool(created)
+
+
+class DocumentRepository:
+    """A single small node read and written as a whole (settings, metal rates)"""
+
+    def __init__(self, backend, node):
+        self.backend = backend
+        self.node = node
+
+    def get(self):
+        return self.backend.reference(self.node).get() or {}
+
+    def set(self, value):
+        self.backend.reference(self.node).set(value)
+
+    def update(self, changes):
+        self.backend.reference(self.node).update(changes)
+
+
+class WishlistRepository(NodeRepository):
+    """wishlists/{mobile}/{product_id}"""
+
+    def items(self, mobile):
+        return self.get(mobile) or {}
+
+    def add(self, mobile, product_id, entry):
+        self.put(f'{mobile}/{product_id}', entry)
+
+    def remove(self, mobile, product_id):
+        self.delete(f'{mobile}/{product_id}')
+
+    def contains(self, mobile, product_id):
+        return self.get(f'{mobile}/{product_id}') is not None
+
+
+class Repositories:
+    """Every repository of the app over one backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.products = NodeRepository(backend, 'products')
+        self.categories = NodeRepository(backend, 'categories')
+        self.customers = NodeRepository(backend, 'customers')
+        self.users = NodeRepository(backend, 'users')
+        self.user_emails = NodeRepository(backend, 'user_emails')
+        self.wishlists = WishlistRepository(backend, 'wishlists')
+        self.meta = NodeRepository(backend, 'meta')
+        self.rate_history = NodeRepository(backend, 'rate_history')
+        self.metal_rates = DocumentRepository(backend, 'metal_rates')
+        self.settings = DocumentRepository(backend, 'settings')
+
+    def read_node(self, name):
+        """Raw value of a top-level node, used by the config cache loader"""
+        return self.backend.reference(name).get()
+
+    def update_paths(self, updates):
+        """Multi-path update of {'node/key/...': value} applied atomically"""
+        self.backend.reference('/').update(updates)
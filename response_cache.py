@@ -0,0 +1,150 @@
+"""
+Rendered-page cache for Samrat Jewellers
+
+Public pages only change when an admin edits products, categories, settings
+or rates, so rendered responses are cached under the route, its normalized
+query string and a data-version vector. Entries carry strong ETags so repeat
+visitors get a 304 without a body.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+
+class ResponseCache:
+    """LRU cache of rendered bodies bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        entry = {
+            'body': body,
+            'mimetype': mimetype,
+            'etag': hashlib.sha256(body).hexdigest()[:32]
+        }
+        # Oversized pages are served but never cached
+        if len(body) > self.max_bytes // 4:
+            return entry
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old['body'])
+            self._entries[key] = entry
+            self._bytes += len(body)
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted['body'])
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def respond(self, entry):
+        response = Response(entry['body'], mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        # Browsers may keep the page but must revalidate it with If-None-Match
+        response.headers['Cache-Control'] = 'no-cache'
+        response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+        return response
+
+
+def normalized_args():
+    """Query args sorted by name, with empty values dropped"""
+    return tuple(sorted((key, value) for key, value in request.args.items(multi=True) if value))
+
+
+def version_tag(version):
+    """Short stable digest of a data-version vector"""
+    return hashlib.sha1(repr(version).encode()).hexdigest()[:12]
+
+
+def versioned_page(data_version):
+    """Mark a public GET page as shareable with an X-Data-Version header
+
+    The service worker only keeps pages carrying the header, and drops them
+    once the version it was generated with moves on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            shared = request.method == 'GET' and not session.get('_flashes')
+            response = make_response(view(*args, **kwargs))
+            if shared and response.status_code == 200:
+                response.headers['X-Data-Version'] = version_tag(data_version())
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_page(cache, data_version):
+    """Serve a GET view from cache; data_version() returns the version vector"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages carrying flashed messages are specific to one visitor
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            route = (request.endpoint, tuple(sorted(kwargs.items())), normalized_args())
+            version = data_version()
+            entry = cache.get(route + (version,))
+            if entry is None:
+                response = view(*args, **kwargs)
+                if not isinstance(response, Response):
+                    response = Response(response)
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                # A write that landed while rendering may or may not be in the
+                # body, so it is only kept when the version didn't move
+                if data_version() != version:
+                    return response
+                entry = cache.put(route + (version,), response.get_data(), response.mimetype)
+            return cache.respond(entry)
+        return wrapper
+    return decorator
@@ -0,0 +1,133 @@
+"""
+Inverted search index for Samrat Jewellers
+
+Maps lowercase terms from name, sku, category and description to product
+ids. Every query term is matched as a prefix, so partial words and SKU
+fragments ("gc00") still find products, and a search only touches the
+postings of matching terms instead of every product.
+"""
+
+import bisect
+import re
+import threading
+
+SEARCH_FIELDS = ('name', 'sku', 'category', 'description')
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text or '').lower())
+
+
+def product_terms(product):
+    # Normalized documents carry the terms computed when they were written
+    stored = product.get('search_terms')
+    if isinstance(stored, list):
+        return set(stored)
+    terms = set()
+    for field in SEARCH_FIELDS:
+        terms.update(tokenize(product.get(field)))
+    # Also index the SKU without separators so "GC-001" matches "gc001"
+    sku = ''.join(tokenize(product.get('sku')))
+    if sku:
+        terms.add(sku)
+    return terms
+
+
+class SearchIndex:
+    """Term -> product id postings with a sorted term list for prefix lookups"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}   # term -> set of product ids
+        self._terms = []      # sorted terms, for prefix ranges
+        self._doc_terms = {}  # product id -> terms, for removal
+        self._order = {}      # product id -> insertion sequence (catalog order)
+        self._sequence = 0
+
+    def apply(self, product_id, product):
+        """CatalogSnapshot subscriber: product_id None means a full reload"""
+        if product_id is None:
+            self.rebuild(product or {})
+        elif product is None:
+            self.remove(product_id)
+        else:
+            self.add(product_id, product)
+
+    def rebuild(self, products):
+        postings = {}
+        doc_terms = {}
+        order = {}
+        for product_id, product in products.items():
+            terms = doc_terms[product_id] = product_terms(product)
+            order[product_id] = len(order)
+            for term in terms:
+                postings.setdefault(term, set()).add(product_id)
+
+        with self._lock:
+            self._postings = postings
+            self._terms = sorted(postings)
+            self._doc_terms = doc_terms
+            self._order = order
+            self._sequence = len(order)
+
+    def add(self, product_id, product):
+        """Index a new product or re-index an edited one"""
+        terms = product_terms(product)
+        with self._lock:
+            old_terms = self._doc_terms.get(product_id, set())
+            for term in old_terms - terms:
+                self._remove_posting(term, product_id)
+            for term in terms - old_terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = set()
+                    bisect.insort(self._terms, term)
+                postings.add(product_id)
+
+            self._doc_terms[product_id] = terms
+            if product_id not in self._order:
+                self._order[product_id] = self._sequence
+                self._sequence += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            for term in self._doc_terms.pop(product_id, ()):
+                self._remove_posting(term, product_id)
+            self._order.pop(product_id, None)
+
+    def search(self, query):
+        """Return ids matching every query term (as a prefix), in catalog order"""
+        query_terms = tokenize(query)
+        if not query_terms:
+            return []
+
+        with self._lock:
+            matches = None
+            # Start with the longest term, it usually has the fewest postings
+            for term in sorted(set(query_terms), key=len, reverse=True):
+                term_matches = self._prefix_postings(term)
+                matches = term_matches if matches is None else matches & term_matches
+                if not matches:
+                    return []
+            return sorted(matches, key=self._order.__getitem__)
+
+    def _prefix_postings(self, prefix):
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + '\x7f', start)
+        if end - start == 1:
+            return set(self._postings[self._terms[start]])
+        ids = set()
+        for term in self._terms[start:end]:
+            ids.update(self._postings[term])
+        return ids
+
+    def _remove_posting(self, term, product_id):
+        postings = self._postings.get(term)
+        if postings is None:
+            return
+        postings.discard(product_id)
+        if not postings:
+            del self._postings[term]
+            del self._terms[bisect.bisect_left(self._terms, term)]
@@ -145,11 +145,17 @@ document.addEventListener('DOMContentLoaded', function() {
     
     images.forEach(img => imageObserver.observe(img));
     
+    // Load more products for paginated grids
+    initializeLoadMore();
+    
     // Rate freshness color coding
     updateRateFreshness();
     
     // Update rate freshness every minute
     setInterval(updateRateFreshness, 60000);
+    
+    // Live rates and prices pushed by the server
+    initializeRateStream();
 });
 
 // Function to update rate freshness indicators
@@ -182,6 +188,137 @@ function updateRateFreshness() {
     });
 }
 
+// Server-Sent Events with new metal rates and the prices of products on the page
+let rateStream = null;
+const MAX_STREAM_PRODUCTS = 100;  // the server ignores ids past this many
+
+// Cards on screen first, then the most recently loaded ones, so the cards
+// infinite scroll just added aren't the ones left out
+function streamProductIds(priceElements) {
+    const visible = [];
+    const others = [];
+    priceElements.forEach(element => {
+        const rect = element.getBoundingClientRect();
+        const onScreen = rect.bottom > 0 && rect.top < window.innerHeight;
+        (onScreen ? visible : others).push(element.dataset.priceId);
+    });
+    return [...new Set([...visible, ...others.reverse()])].slice(0, MAX_STREAM_PRODUCTS);
+}
+
+function initializeRateStream() {
+    if (rateStream) {
+        rateStream.close();
+        rateStream = null;
+    }
+    const rateElements = document.querySelectorAll('[data-rate-metal]');
+    const priceElements = document.querySelectorAll('[data-price-id]');
+    if (!window.EventSource || (!rateElements.length && !priceElements.length)) {
+        return;
+    }
+    
+    const ids = streamProductIds(priceElements);
+    rateStream = new EventSource(`/events/rates?ids=${encodeURIComponent(ids.join(','))}`);
+    
+    rateStream.addEventListener('rates', (event) => {
+        const data = JSON.parse(event.data);
+        
+        document.querySelectorAll('[data-rate-metal]').forEach(element => {
+            const rate = data.rates[element.dataset.rateMetal];
+            if (!rate || rate.rate_per_gram == null) {
+                return;
+            }
+            const text = `₹${rate.rate_per_gram.toFixed(2)}/gram`;
+            if (element.textContent !== text) {
+                element.textContent = text;
+                const freshness = element.parentElement.querySelector('.rate-time span');
+                if (freshness) {
+                    freshness.textContent = 'Updated just now';
+                    freshness.classList.remove('rate-moderate', 'rate-old');
+                    freshness.classList.add('rate-fresh');
+                }
+            }
+        });
+        
+        document.querySelectorAll('[data-price-id]').forEach(element => {
+            const price = data.prices[element.dataset.priceId];
+            if (price != null) {
+                element.textContent = `₹${Math.round(price)}`;
+            }
+        });
+    });
+}
+
+// Give the server its connection back when the page goes away
+window.addEventListener('pagehide', () => {
+    if (rateStream) {
+        rateStream.close();
+        rateStream = null;
+    }
+});
+
+window.addEventListener('pageshow', (event) => {
+    if (event.persisted) {
+        initializeRateStream();
+    }
+});
+
+// Infinite scroll for paginated product grids (falls back to a plain link)
+function initializeLoadMore() {
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+    const grid = document.querySelector('.products-grid');
+    if (!loadMoreBtn || !grid) {
+        return;
+    }
+    
+    let loading = false;
+    
+    const observer = new IntersectionObserver((entries) => {
+        if (entries[0].isIntersecting) {
+            loadMore();
+        }
+    }, {
+        rootMargin: '400px'
+    });
+    
+    async function loadMore() {
+        const url = loadMoreBtn.dataset.moreUrl;
+        if (loading || !url) {
+            return;
+        }
+        
+        loading = true;
+        try {
+            const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+            const data = await response.json();
+            
+            grid.insertAdjacentHTML('beforeend', data.html);
+            
+            // Reconnect so the new cards' prices are pushed too
+            initializeRateStream();
+            
+            if (data.more_url) {
+                loadMoreBtn.dataset.moreUrl = data.more_url;
+                loadMoreBtn.href = data.next_page_url;
+            } else {
+                observer.disconnect();
+                loadMoreBtn.parentElement.remove();
+            }
+        } catch (error) {
+            console.error('Failed to load more products:', error);
+        } finally {
+            loading = false;
+        }
+    }
+    
+    loadMoreBtn.addEventListener('click', function(e) {
+        e.preventDefault();
+        e.stopImmediatePropagation();
+        loadMore();
+    });
+    
+    observer.observe(loadMoreBtn);
+}
+
 // WhatsApp integration helper
 function formatWhatsAppMessage(productName, sku, weight, price, metalType, currentRate) {
     const timestamp = new Date().toLocaleString('en-IN', {
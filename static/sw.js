@@ -1,29 +0,0 @@
-const CACHE_NAME = 'samrat-jewellers-v2';
-const urlsToCache = [
-  '/',
-  '/static/css/style.css',
-  '/static/js/script.js',
-  '/static/images/logo.png',
-  '/static/manifest.json'
-];
-
-self.addEventListener('install', (event) => {
-  event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then((cache) => cache.addAll(urlsToCache))
-  );
-  self.skipWaiting();
-});
-
-self.addEventListener('fetch', (event) => {
-  event.respondWith(
-    caches.match(event.request)
-      .then((response) => {
-        if (response) {
-          return response;
-        }
-        return fetch(event.request);
-      }
-    )
-  );
-});
@@ -0,0 +1,505 @@
+"""
+Storage backends for Samrat Jewellers
+
+Every backend exposes Firebase-style references (get, set, update, delete,
+child, listen, transaction) so the repositories and the app don't care where
+the tree lives:
+
+- FirebaseBackend: the Realtime Database through firebase_admin
+- SQLiteBackend: the same tree as JSON documents in a local SQLite file
+- MemoryBackend: a plain dict with injectable round-trip latency and
+  payload-size costs, for benchmarking every route offline
+
+Backend calls are counted per request through a context variable, so
+X-Backend-Calls works the same on all of them.
+"""
+
+import contextlib
+import contextvars
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+_call_counter = contextvars.ContextVar('backend_call_counter', default=None)
+
+
+def start_call_count():
+    """Begin counting backend calls for the current request"""
+    counter = [0]
+    _call_counter.set(counter)
+    return counter
+
+
+def call_count():
+    counter = _call_counter.get()
+    return counter[0] if counter is not None else 0
+
+
+def count_call():
+    counter = _call_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def split_path(path):
+    return [part for part in str(path or '').split('/') if part]
+
+
+class Event:
+    """Listener event shaped like firebase_admin.db.Event"""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class ListenerRegistration:
+    def __init__(self, backend, listener):
+        self._backend = backend
+        self._listener = listener
+
+    def close(self):
+        self._backend._remove_listener(self._listener)
+
+
+# Firebase
+
+class CountingReference:
+    """Wraps a firebase_admin reference so its network calls are counted"""
+
+    def __init__(self, ref):
+        self._ref = ref
+
+    @property
+    def key(self):
+        return self._ref.key
+
+    def child(self, path):
+        return CountingReference(self._ref.child(path))
+
+    def get(self, *args, **kwargs):
+        count_call()
+        return self._ref.get(*args, **kwargs)
+
+    def set(self, value):
+        count_call()
+        return self._ref.set(value)
+
+    def update(self, value):
+        count_call()
+        return self._ref.update(value)
+
+    def delete(self):
+        count_call()
+        return self._ref.delete()
+
+    def transaction(self, transaction_update):
+        count_call()
+        return self._ref.transaction(transaction_update)
+
+    def listen(self, callback):
+        return self._ref.listen(callback)
+
+    def __getattr__(self, name):
+        # Query builders (order_by_child, limit_to_first, ...) pass straight through
+        return getattr(self._ref, name)
+
+
+def firebase_credentials(config_path='firebase_config.json'):
+    from firebase_admin import credentials
+
+    # Try local config first, then environment variables
+    try:
+        return credentials.Certificate(config_path)
+    except FileNotFoundError:
+        # Create Firebase config from environment variables
+        firebase_config = {
+            "type": "service_account",
+            "project_id": "samrat-4d6b3",
+            "private_key_id": os.environ.get('FIREBASE_PRIVATE_KEY_ID'),
+            "private_key": os.environ.get('FIREBASE_PRIVATE_KEY', ''),
+            "client_email": os.environ.get('FIREBASE_CLIENT_EMAIL'),
+            "client_id": os.environ.get('FIREBASE_CLIENT_ID'),
+            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+            "token_uri": "https://oauth2.googleapis.com/token",
+            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+            "client_x509_cert_url": f"https://www.googleapis.com/robot/v1/metadata/x509/{os.environ.get('FIREBASE_CLIENT_EMAIL', '')}"
+        }
+
+        # Write config to temporary file
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            json.dump(firebase_config, f)
+            temp_config_path = f.name
+
+        return credentials.Certificate(temp_config_path)
+
+
+class FirebaseBackend:
+    name = 'firebase'
+
+    def __init__(self, database_url, config_path='firebase_config.json'):
+        import firebase_admin
+        from firebase_admin import db
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(firebase_credentials(config_path), {
+                'databaseURL': database_url
+            })
+        self._db = db
+
+    def reference(self, path='/'):
+        return CountingReference(self._db.reference(path))
+
+    def children(self, path, after=None, limit=500):
+        """Up to limit (key, value) children of path with keys after `after`, in key order"""
+        count_call()
+        query = self._db.reference(path).order_by_key()
+        if after is not None:
+            # start_at is inclusive, so ask for one more and drop `after` itself
+            query = query.start_at(after)
+        result = query.limit_to_first(limit + (after is not None)).get() or {}
+        return [(key, value) for key, value in result.items() if key != after][:limit]
+
+    def children_equal(self, path, field, value):
+        """{key: child} of the children of path whose field equals value"""
+        count_call()
+        try:
+            return dict(self._db.reference(path).order_by_child(field).equal_to(value).get() or {})
+        except Exception as e:
+            # Refused without an ".indexOn" rule for field; scan the node instead
+            print(f"Query on {path}/{field} failed, scanning: {e}")
+            count_call()
+            children = self._db.reference(path).get() or {}
+            return {key: child for key, child in children.items() if isinstance(child, dict) and child.get(field) == value}
+
+
+# Local tree backends
+
+class TreeReference:
+    """Reference into a LocalTreeBackend"""
+
+    def __init__(self, backend, path):
+        self._backend = backend
+        self._parts = split_path(path)
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return '/' + '/'.join(self._parts)
+
+    def child(self, path):
+        return TreeReference(self._backend, '/'.join(self._parts + split_path(path)))
+
+    def get(self):
+        return self._backend.read(self._parts)
+
+    def set(self, value):
+        self._backend.write({tuple(self._parts): value})
+
+    def update(self, value):
+        self._backend.write({tuple(self._parts + split_path(key)): child for key, child in value.items()})
+
+    def delete(self):
+        self._backend.write({tuple(self._parts): None})
+
+    def push(self, value=''):
+        key = f'{time.time_ns():x}'
+        ref = self.child(key)
+        ref.set(value)
+        return ref
+
+    def transaction(self, transaction_update):
+        return self._backend.transaction(self._parts, transaction_update)
+
+    def listen(self, callback):
+        return self._backend.listen(self._parts, callback)
+
+
+class LocalTreeBackend:
+    """Shared listener and transaction plumbing for the local backends"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held from the end of a write until its events are delivered, so
+        # listeners see changes in the order they were made
+        self._delivery = threading.RLock()
+        self._listeners = []
+
+    def reference(self, path='/'):
+        return TreeReference(self, path)
+
+    def read(self, parts):
+        count_call()
+        with self._lock:
+            value = self._read(parts)
+        return copy.deepcopy(value)
+
+    def write(self, changes):
+        """Apply {path tuple: value} changes atomically (None deletes)"""
+        count_call()
+        with self._lock:
+            with self._atomic():
+                for parts, value in changes.items():
+                    self._write(list(parts), copy.deepcopy(value))
+            events = self._events([list(parts) for parts in changes])
+            self._delivery.acquire()
+        self._deliver(events)
+
+    def children(self, path, after=None, limit=500):
+        """Up to limit (key, value) children of path with keys after `after`, in key order"""
+        count_call()
+        with self._lock:
+            items = self._children(split_path(path), after, limit)
+        return copy.deepcopy(items)
+
+    def children_equal(self, path, field, value):
+        """{key: child} of the children of path whose field equals value"""
+        count_call()
+        with self._lock:
+            children = self._read(split_path(path)) or {}
+            matches = {key: child for key, child in children.items() if isinstance(child, dict) and child.get(field) == value}
+        return copy.deepcopy(matches)
+
+    def transaction(self, parts, transaction_update):
+        count_call()
+        with self._lock:
+            with self._atomic():
+                value = transaction_update(copy.deepcopy(self._read(parts)))
+                self._write(list(parts), copy.deepcopy(value))
+            events = self._events([list(parts)])
+            self._delivery.acquire()
+        self._deliver(events)
+        return value
+
+    def listen(self, parts, callback):
+        listener = (list(parts), callback)
+        with self._lock:
+            self._listeners.append(listener)
+            data = copy.deepcopy(self._read(parts))
+            self._delivery.acquire()
+        # Like Firebase, the first event carries the whole subtree
+        self._deliver([(callback, Event('put', '/', data))])
+        return ListenerRegistration(self, listener)
+
+    def _remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    @contextlib.contextmanager
+    def _atomic(self):
+        """Makes the writes inside it one unit; the lock already isolates them"""
+        yield
+
+    def _events(self, changed_paths):
+        """(callback, Event) pairs for changed paths, read while the lock is held"""
+        events = []
+        for base, callback in self._listeners:
+            for changed in changed_paths:
+                if changed[:len(base)] == base:
+                    relative = '/' + '/'.join(changed[len(base):])
+                    data = self._read(changed)
+                elif base[:len(changed)] == changed:
+                    relative = '/'
+                    data = self._read(base)
+                else:
+                    continue
+                events.append((callback, Event('put', relative, copy.deepcopy(data))))
+        return events
+
+    def _deliver(self, events):
+        """Run listener callbacks outside the tree lock, releasing the delivery lock taken under it"""
+        try:
+            for callback, event in events:
+                callback(event)
+        finally:
+            self._delivery.release()
+
+    def _children(self, parts, after, limit):
+        node = self._read(parts)
+        if not isinstance(node, dict):
+            return []
+        keys = sorted(key for key in node if after is None or key > after)[:limit]
+        return [(key, node[key]) for key in keys]
+
+    def _read(self, parts):
+        raise NotImplementedError
+
+    def _write(self, parts, value):
+        raise NotImplementedError
+
+
+def _tree_get(tree, parts):
+    node = tree
+    for part in parts:
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node
+
+
+def _tree_set(tree, parts, value):
+    """Set value at parts inside tree, pruning empty parents; returns the new tree"""
+    if not parts:
+        return value
+    tree = tree if isinstance(tree, dict) else {}
+    child = _tree_set(tree.get(parts[0]), parts[1:], value)
+    if child is None or child == {}:
+        tree.pop(parts[0], None)
+    else:
+        tree[parts[0]] = child
+    return tree
+
+
+class MemoryBackend(LocalTreeBackend):
+    """In-memory tree with injected round-trip latency and payload costs
+
+    latency is the fixed cost of every call in seconds; seconds_per_kb adds a
+    cost proportional to the JSON size of the data read or written, so
+    whole-catalog reads get slower as the catalog grows.
+    """
+
+    name = 'memory'
+
+    def __init__(self, data=None, latency=0.0, seconds_per_kb=0.0):
+        super().__init__()
+        self._tree = copy.deepcopy(data) or {}
+        self.latency = latency
+        self.seconds_per_kb = seconds_per_kb
+
+    def read(self, parts):
+        value = super().read(parts)
+        self._delay(value)
+        return value
+
+    def write(self, changes):
+        self._delay(list(changes.values()))
+        super().write(changes)
+
+    def children(self, path, after=None, limit=500):
+        items = super().children(path, after, limit)
+        self._delay(items)
+        return items
+
+    def transaction(self, parts, transaction_update):
+        self._delay(None)
+        return super().transaction(parts, transaction_update)
+
+    def _delay(self, payload):
+        cost = self.latency
+        if self.seconds_per_kb and payload is not None:
+            cost += len(json.dumps(payload, separators=(',', ':'))) / 1024 * self.seconds_per_kb
+        if cost > 0:
+            time.sleep(cost)
+
+    def _read(self, parts):
+        return _tree_get(self._tree, parts)
+
+    def _write(self, parts, value):
+        self._tree = _tree_set(self._tree, parts, value) or {}
+
+
+class SQLiteBackend(LocalTreeBackend):
+    """The tree stored as one JSON document per top-level child
+
+    Row keys are "node/child" (e.g. "products/GC001"), so reading one product
+    or one customer is a primary-key lookup and a whole node is a range scan.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path='samrat_jewellers_tree.db'):
+        super().__init__()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def _read(self, parts):
+        if len(parts) >= 2:
+            row = self._conn.execute('SELECT value FROM documents WHERE path = ?',
+                                     (f'{parts[0]}/{parts[1]}',)).fetchone()
+            return _tree_get(json.loads(row[0]), parts[2:]) if row else None
+
+        if parts:
+            rows = self._conn.execute('SELECT path, value FROM documents WHERE path >= ? AND path < ?',
+                                      (f'{parts[0]}/', f'{parts[0]}0'))
+        else:
+            rows = self._conn.execute('SELECT path, value FROM documents')
+        tree = {}
+        for path, value in rows:
+            node, key = path.split('/', 1)
+            tree.setdefault(node, {})[key] = json.loads(value)
+        return (tree.get(parts[0]) if parts else tree) or None
+
+    def _children(self, parts, after, limit):
+        if len(parts) != 1:
+            return super()._children(parts, after, limit)
+        # A key range on the primary key instead of loading the whole node
+        start = f'{parts[0]}/{after}' if after is not None else f'{parts[0]}/'
+        rows = self._conn.execute('SELECT path, value FROM documents WHERE path > ? AND path < ? ORDER BY path LIMIT ?',
+                                  (start, f'{parts[0]}0', limit))
+        return [(path.split('/', 1)[1], json.loads(value)) for path, value in rows]
+
+    @contextlib.contextmanager
+    def _atomic(self):
+        # One SQLite transaction for every path of a multi-path update
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def _write(self, parts, value):
+        if len(parts) >= 2:
+            path = f'{parts[0]}/{parts[1]}'
+            if len(parts) > 2:
+                value = _tree_set(self._read(parts[:2]), parts[2:], value)
+            self._put_document(path, value)
+            return
+
+        # Replacing a whole node (or the root) rewrites its documents
+        if parts:
+            value = {parts[0]: value} if value is not None else {}
+        for node, children in (value or {}).items():
+            if children is not None and not isinstance(children, dict):
+                raise ValueError(f"SQLite backend stores top-level nodes as documents per child, "
+                                 f"can't store a {type(children).__name__} at /{node}")
+        if parts:
+            self._conn.execute('DELETE FROM documents WHERE path >= ? AND path < ?',
+                               (f'{parts[0]}/', f'{parts[0]}0'))
+        else:
+            self._conn.execute('DELETE FROM documents')
+        for node, children in (value or {}).items():
+            for key, child in (children or {}).items():
+                self._put_document(f'{node}/{key}', child)
+
+    def _put_document(self, path, value):
+        if value is None or value == {}:
+            self._conn.execute('DELETE FROM documents WHERE path = ?', (path,))
+        else:
+            self._conn.execute('INSERT OR REPLACE INTO documents (path, value) VALUES (?, ?)',
+                               (path, json.dumps(value)))
+
+
+def create_backend(name=None):
+    """Build the backend named by STORAGE_BACKEND (firebase, sqlite or memory)"""
+    name = name or os.environ.get('STORAGE_BACKEND', 'firebase')
+
+    if name == 'firebase':
+        return FirebaseBackend(os.environ.get('FIREBASE_DATABASE_URL', 'https://samrat-4d6b3-default-rtdb.firebaseio.com/'))
+    if name == 'sqlite':
+        return SQLiteBackend(os.environ.get('STORAGE_SQLITE_PATH', 'samrat_jewellers_tree.db'))
+    if name == 'memory':
+        return MemoryBackend(latency=float(os.environ.get('MEMORY_LATENCY_MS', 0)) / 1000,
+                             seconds_per_kb=float(os.environ.get('MEMORY_MS_PER_KB', 0)) / 1000)
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,113 @@
+// Generated by the app at /sw.js. ASSET_VERSION follows the fingerprinted
+// static files and DATA_VERSION the catalog, rates and settings; when either
+// moves on the browser installs this worker again and old caches are dropped.
+const ASSET_VERSION = '{{ asset_version }}';
+const DATA_VERSION = '{{ data_version }}';
+const ASSET_CACHE = `samrat-jewellers-assets-${ASSET_VERSION}`;
+const PAGE_CACHE = `samrat-jewellers-pages-${DATA_VERSION}`;
+const MAX_PAGES = 60;
+
+const PRECACHE_ASSETS = {{ precache | tojson }};
+const PRECACHE_PAGES = ['/'];
+
+// Public catalog pages served stale-while-revalidate
+const PAGE_ROUTES = [/^\/shop$/, /^\/product\/[^/]+$/];
+// Logins and logouts redirect home with a flashed message, which a cached copy
+// would hide while the background fetch used it up, so home goes to the
+// network and the cache is only its offline fallback
+const NETWORK_FIRST_ROUTES = [/^\/$/];
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(Promise.all([
+    caches.open(ASSET_CACHE).then((cache) => cache.addAll(PRECACHE_ASSETS)),
+    caches.open(PAGE_CACHE).then((cache) => Promise.all(
+      PRECACHE_PAGES.map((url) => fetch(url).then((response) => storePage(cache, url, response)))
+    ))
+  ]));
+  self.skipWaiting();
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(
+        names.filter((name) => name !== ASSET_CACHE && name !== PAGE_CACHE).map((name) => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (request.method !== 'GET' || url.origin !== self.location.origin) {
+    return;
+  }
+  if (url.pathname.startsWith('/assets/')) {
+    event.respondWith(cacheFirst(request));
+  } else if (PAGE_ROUTES.some((route) => route.test(url.pathname))) {
+    event.respondWith(staleWhileRevalidate(event));
+  } else if (NETWORK_FIRST_ROUTES.some((route) => route.test(url.pathname))) {
+    event.respondWith(networkFirst(request));
+  }
+});
+
+// Fingerprinted URLs never change content, so a cached copy is always good
+async function cacheFirst(request) {
+  const cache = await caches.open(ASSET_CACHE);
+  const cached = await cache.match(request);
+  if (cached) {
+    return cached;
+  }
+  const response = await fetch(request);
+  if (response.ok) {
+    cache.put(request, response.clone());
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event) {
+  const cache = await caches.open(PAGE_CACHE);
+  const cached = await cache.match(event.request, { ignoreVary: true });
+  const network = fetch(event.request)
+    .then((response) => storePage(cache, event.request, response))
+    .catch((error) => {
+      if (cached) {
+        return cached;
+      }
+      throw error;
+    });
+  if (cached) {
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+async function networkFirst(request) {
+  const cache = await caches.open(PAGE_CACHE);
+  try {
+    return await storePage(cache, request, await fetch(request));
+  } catch (error) {
+    const cached = await cache.match(request, { ignoreVary: true });
+    if (cached) {
+      return cached;
+    }
+    throw error;
+  }
+}
+
+// Only pages the server marked as shared (X-Data-Version) are kept
+async function storePage(cache, request, response) {
+  const version = response.headers.get('X-Data-Version');
+  if (response.ok && version) {
+    await cache.put(request, response.clone());
+    const keys = await cache.keys();
+    await Promise.all(keys.slice(0, Math.max(0, keys.length - MAX_PAGES)).map((key) => cache.delete(key)));
+    if (version !== DATA_VERSION) {
+      // Prices or products changed since this worker was generated
+      self.registration.update();
+    }
+  }
+  return response;
+}
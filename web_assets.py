@@ -0,0 +1,95 @@
+"""
+Asset plumbing shared by app.py and app_simple.py
+
+Both apps serve the same fingerprinted static files, image variants, Drive
+image proxy and service worker. WebAssets builds those pieces for one Flask
+app and registers their template globals and routes:
+
+    asset_url, image_sources, image_srcset, convert_google_drive_url
+    /assets/<hashed name>, /img/<file id>, /sw.js, /static/sw.js (retired)
+"""
+
+from flask import abort, render_template, request, url_for
+
+from assets import StaticAssets
+from image_proxy import create_image_proxy, drive_file_id
+from images import ImagePipeline
+from response_cache import version_tag
+
+# Fingerprinted assets the service worker installs with; admin files and
+# product images are left to be cached on first use
+PRECACHE_INCLUDE = ('css/', 'js/', 'images/', 'manifest.json')
+PRECACHE_EXCLUDE = ('css/admin', 'js/admin', 'images/products/', 'images/derived/')
+
+RETIRED_SERVICE_WORKER = ("self.addEventListener('install', () => self.skipWaiting());\n"
+                          "self.addEventListener('activate', () => self.registration.unregister());\n")
+
+
+class WebAssets:
+    """Static assets, image variants, the Drive image proxy and the service worker of one app
+
+    data_version() returns the version vector of what public pages render;
+    it is baked into the service worker so cached pages are dropped when it
+    moves. image_referenced(file_id) tells whether a product or category
+    shows a Drive file; /img/ answers 404 for any other id.
+    """
+
+    def __init__(self, app, data_version, image_referenced):
+        self.app = app
+        self.data_version = data_version
+        self.image_referenced = image_referenced
+        # Resized WebP/AVIF variants of uploaded images, derived in the background
+        self.images = ImagePipeline(app.static_folder)
+        # Content-hashed, precompressed copies of static files, cached for a year
+        self.static = StaticAssets(app.static_folder)
+        # Drive-hosted images, fetched once and served resized from a disk cache
+        self.proxy = create_image_proxy()
+
+        for function in (self.asset_url, self.image_sources, self.image_srcset, self.convert_google_drive_url):
+            app.add_template_global(function)
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.send_asset)
+        app.add_url_rule('/img/<file_id>', 'drive_image', self.send_drive_image)
+        app.add_url_rule('/sw.js', 'service_worker', self.service_worker)
+        app.add_url_rule('/static/sw.js', 'retired_service_worker', self.retired_service_worker)
+
+    def asset_url(self, filename):
+        hashed = self.static.url_path(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('asset', filename=hashed)
+
+    def image_sources(self, path):
+        return self.images.sources(path, self.asset_url)
+
+    def image_srcset(self, url):
+        return self.proxy.srcset(url, lambda file_id, width: url_for('drive_image', file_id=file_id, w=width))
+
+    def convert_google_drive_url(self, url):
+        """Route Google Drive image links through the /img/ proxy"""
+        file_id = drive_file_id(url)
+        if file_id:
+            return url_for('drive_image', file_id=file_id)
+        return url
+
+    def send_asset(self, filename):
+        return self.static.send(filename, request.accept_encodings)
+
+    def send_drive_image(self, file_id):
+        if not self.image_referenced(file_id):
+            abort(404)
+        return self.proxy.send(file_id, request.args.get('w', type=int), request.accept_mimetypes)
+
+    def service_worker(self):
+        precache = [url_for('asset', filename=name) for name in self.static.precache(PRECACHE_INCLUDE, PRECACHE_EXCLUDE)]
+        script = render_template('sw.js', asset_version=self.static.version,
+                                 data_version=version_tag(self.data_version()), precache=precache)
+        return self._script(script)
+
+    def retired_service_worker(self):
+        # Replaces the worker older pages registered under /static/ so it unregisters itself
+        return self._script(RETIRED_SERVICE_WORKER)
+
+    def _script(self, script):
+        response = self.app.response_class(script, mimetype='application/javascript')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response